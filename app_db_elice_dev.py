@@ -1,32 +1,53 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import random
+import os
 import re
+from lucy_core import MenuIndex
+from lucy_core.combos import top_pairs
+from lucy_core.db import init_db
+from lucy_core.menu import MenuWatcher, load_menu_snapshot
+from lucy_core.userstore import MemoryBackend, SQLiteBackend, UserStore
 
 # --- 데이터 로드 및 전처리 ---
-@st.cache_data
-def load_data(file_path):
-    """메뉴 데이터 로드 및 전처리"""
+def build_menu(snap):
+    """메뉴 데이터 전처리 + 카테고리별 행 번호 / 태그별 비트맵 인덱스 (메뉴 버전당 1회 생성)"""
+    df = snap.frame()
+    # 태그를 리스트 형태로 변환 (예: "#달콤한,#부드러운" -> ['달콤한', '부드러운'])
+    df['tags_list'] = df['tags'].apply(lambda x: [re.sub(r'#', '', tag).strip() for tag in x.split(',')])
+    return df, MenuIndex(snap)
+
+@st.cache_resource
+def load_menu(file_path):
+    """현재 메뉴 (DataFrame, 인덱스). 파일이 바뀌면 감시 스레드가 새 버전을 만들어 통째로 교체"""
     try:
-        df = pd.read_csv(file_path)
-        # 태그를 리스트 형태로 변환 (예: "#달콤한,#부드러운" -> ['달콤한', '부드러운'])
-        df['tags_list'] = df['tags'].apply(lambda x: [re.sub(r'#', '', tag).strip() for tag in x.split(',')])
-        return df
+        snap = load_menu_snapshot(file_path)
     except FileNotFoundError:
         st.error(f"⚠️ 에러: {file_path} 파일을 찾을 수 없습니다. 파일을 확인해주세요.")
-        return pd.DataFrame()
+        return {'menu': (pd.DataFrame(), None)}
+    live = {'menu': build_menu(snap)}
+    def swap(new_snap):
+        live['menu'] = build_menu(new_snap)
+    MenuWatcher(file_path, swap, float(os.environ.get('LUCY_MENU_RELOAD_INTERVAL', 2)), snap.sha1).start()
+    return live
 
-menu_df = load_data('menu (1).csv')
+menu_df, menu_index = load_menu('menu (1).csv')['menu']  # 한 번의 실행(rerun) 동안 같은 버전 사용
 
+# 화면용 태그('#' 제거) -> 인덱스 태그
+tag_keys = {re.sub(r'#', '', tag).strip(): tag for tag in menu_index.tags} if menu_index else {}
 # 사용 가능한 모든 태그 추출 (중복 제거)
-all_tags = sorted(list(set(tag for sublist in menu_df['tags_list'].dropna() for tag in sublist)))
+all_tags = sorted(tag_keys)
 
-# 사용자 DB (간단한 딕셔너리로 구현, 실제 서비스에서는 데이터베이스 사용 필요)
+# 사용자 DB: 모든 세션이 공유하는 프로세스 단위 저장소 (lucy.db에 write-through, LUCY_USER_STORE=memory 이면 메모리만)
 # {전화번호: {'coupons': int, 'visits': int}}
-user_db = {}
-# 초기 쿠폰함 설정
-if 'user_db' not in st.session_state:
-    st.session_state['user_db'] = user_db
+@st.cache_resource
+def load_user_store():
+    if os.environ.get('LUCY_USER_STORE') == 'memory':
+        return UserStore(MemoryBackend())
+    init_db()
+    return UserStore(SQLiteBackend())
+
+user_db = load_user_store()
 if 'phone_number' not in st.session_state:
     st.session_state['phone_number'] = None
 if 'page' not in st.session_state:
@@ -41,14 +62,16 @@ def set_page(page_name):
 def show_coupon_status():
     """현재 사용자의 쿠폰 상태 표시"""
     phone = st.session_state['phone_number']
-    if phone and phone in st.session_state['user_db']:
-        coupons = st.session_state['user_db'][phone]['coupons']
+    user = user_db.get(phone) if phone else None
+    if user:
+        coupons = user['coupons']
         st.sidebar.markdown(f"**🎫 쿠폰함**")
         st.sidebar.info(f"사용 가능한 쿠폰: **{coupons}개**")
 
 def use_coupon_toggle():
     """쿠폰 사용 여부 체크박스 및 적용 로직"""
-    if st.session_state['phone_number'] and st.session_state['user_db'][st.session_state['phone_number']]['coupons'] > 0:
+    user = user_db.get(st.session_state['phone_number']) if st.session_state['phone_number'] else None
+    if user and user['coupons'] > 0:
         st.session_state['use_coupon'] = st.checkbox(
             '🎫 쿠폰 1개 사용 (총 주문 금액 1,000원 할인)',
             value=st.session_state.get('use_coupon', False)
@@ -58,18 +81,24 @@ def use_coupon_toggle():
         st.markdown("<p style='color:gray;'>사용 가능한 쿠폰이 없습니다.</p>", unsafe_allow_html=True)
 
 # --- 메뉴 추천 로직 ---
-def recommend_menus(df, budget, selected_tags, recommendation_count=3):
-    """예산 및 태그를 고려한 메뉴 조합 추천"""
+def tag_match_counts(tags):
+    """행마다 선택 태그를 몇 개 가졌는지 (태그 비트맵 합)"""
+    counts = np.zeros(menu_index.n, dtype=np.int64)
+    for t in tags or ():
+        counts += np.unpackbits(menu_index.by_tag[t], count=menu_index.n)
+    return counts
 
-    # 1. 태그 필터링 (선택된 태그를 하나라도 포함하는 메뉴)
-    if selected_tags:
-        filtered_df = df[df['tags_list'].apply(lambda x: any(tag in selected_tags for tag in x))]
-    else:
-        filtered_df = df
+def recommend_menus(df, budget, selected_tags, recommendation_count=3, seed=0):
+    """예산 및 태그를 고려한 메뉴 조합 추천 (seed가 같으면 항상 같은 결과)"""
+
+    # 1. 태그 필터링 (선택된 태그를 하나라도 포함하는 메뉴) - 태그 비트맵 합집합
+    tags = [tag_keys[t] for t in selected_tags if t in tag_keys] if selected_tags else None
+    def pick(categories=None):
+        return df.iloc[menu_index.rows(categories, tags)]
+    filtered_df = pick()
 
     # 2. 메뉴 카테고리 분리 (음료/베이커리/기타)
-    drink_df = filtered_df[filtered_df['category'].isin(['커피', '음료', '티'])]
-    bakery_df = filtered_df[filtered_df['category'].isin(['빵', '디저트'])]
+    drink_df = pick(['커피', '음료', '티'])
     
     # 예시 CSV에는 '음료' 카테고리가 없어서 '커피', '티'로 대체. 실제 데이터에 맞게 수정 필요.
     # CSV 내용 확인: '샌드위치', '샐러드', '디저트', '빵' -> 음료/커피 카테고리는 가상의 분류가 필요함.
@@ -80,9 +109,10 @@ def recommend_menus(df, budget, selected_tags, recommendation_count=3):
     recommendations = []
     
     # 최소한의 메뉴 조합을 시도 (예: 1 베이커리/디저트 + 1 기타/식사)
-    main_menu_df = filtered_df[filtered_df['category'].isin(['샌드위치', '샐러드'])]
+    main_pos = menu_index.rows(['샌드위치', '샐러드'], tags)
+    bakery_pos = menu_index.rows(['빵', '디저트'], tags)
     
-    if main_menu_df.empty or bakery_df.empty:
+    if len(main_pos) == 0 or len(bakery_pos) == 0:
         # 단품으로 예산 내에서 추천
         single_items = filtered_df[filtered_df['price'] <= budget].sort_values(by='price', ascending=False)
         for _, row in single_items.head(recommendation_count).iterrows():
@@ -93,33 +123,23 @@ def recommend_menus(df, budget, selected_tags, recommendation_count=3):
              st.warning("⚠️ 선택하신 조건으로는 다양한 조합이 어렵습니다. 예산 내의 단품 메뉴를 추천합니다.")
         return recommendations
     
-    # 메인 + 베이커리 조합 추천 시도
-    attempts = 0
-    while len(recommendations) < recommendation_count and attempts < 100:
-        attempts += 1
-        
-        # 무작위로 메인 메뉴와 베이커리 메뉴 선택
-        main_item = main_menu_df.sample(1).iloc[0]
-        bakery_item = bakery_df.sample(1).iloc[0]
-        
-        total_price = main_item['price'] + bakery_item['price']
-        
-        if total_price <= budget:
-            combo = (
-                f"**{main_item['name']}** + **{bakery_item['name']}** "
-                f"(총 {total_price}원)"
-            )
-            # 중복 방지
-            if combo not in [rec.split('(')[0].strip() for rec in recommendations]:
-                recommendations.append(combo)
+    # 메인 + 베이커리 조합 추천: 가능한 모든 (메인, 베이커리) 쌍을 예산 마스크로 한 번에 평가
+    # 점수 = 선택 태그 일치 수, 같으면 예산을 더 쓰는 조합, 같으면 seed로 정한 순서 (같은 입력 -> 같은 결과)
+    match = tag_match_counts(tags)
+    prices = df['price'].to_numpy()
+    names = df['name'].to_numpy()
+    for i, j, total_price, _ in top_pairs(prices[main_pos], prices[bakery_pos], budget, recommendation_count,
+                                           match[main_pos], match[bakery_pos], seed=seed):
+        recommendations.append(f"**{names[main_pos[i]]}** + **{names[bakery_pos[j]]}** (총 {total_price}원)")
 
     # 조합이 부족할 경우, 가장 비싼 단품 메뉴 추가
     if len(recommendations) < recommendation_count:
+        seen = set(recommendations)
         single_items = filtered_df[filtered_df['price'] <= budget].sort_values(by='price', ascending=False)
         for _, row in single_items.head(recommendation_count - len(recommendations)).iterrows():
             combo = f"**{row['name']}** (단품, {row['price']}원)"
-            if combo not in [rec.split('(')[0].strip() for rec in recommendations]:
-                recommendations.append(combo)
+            if combo not in seen:
+                recommendations.append(combo); seen.add(combo)
             
     return recommendations
 
@@ -143,12 +163,11 @@ def home_page():
             st.session_state['phone_number'] = phone_input
             
             # DB 조회 또는 신규 등록
-            if phone_input not in st.session_state['user_db']:
-                st.session_state['user_db'][phone_input] = {'coupons': 0, 'visits': 1}
+            user, is_new = user_db.check_in(phone_input)
+            if is_new:
                 st.success(f"🎉 신규 고객님으로 등록되었습니다!")
             else:
-                st.session_state['user_db'][phone_input]['visits'] += 1
-                st.info(f"✨ {phone_input} 고객님, 다시 오셨네요! 방문 횟수: {st.session_state['user_db'][phone_input]['visits']}회")
+                st.info(f"✨ {phone_input} 고객님, 다시 오셨네요! 방문 횟수: {user['visits']}회")
             
             set_page('recommend')
             st.rerun()
@@ -223,17 +242,16 @@ def order_complete_page():
     
     phone = st.session_state['phone_number']
     
-    # 1. 쿠폰 사용 처리
-    if st.session_state.get('use_coupon') and phone in st.session_state['user_db']:
-        st.session_state['user_db'][phone]['coupons'] -= 1
-        st.warning("🎫 쿠폰 1개가 사용되었습니다.")
+    # 1. 쿠폰 사용 + 2. 쿠폰 발급 (한 번에 저장, 이 페이지의 재실행에서는 다시 처리하지 않음)
+    if st.session_state.get('order_result') is None and phone and user_db.get(phone):
+        st.session_state['order_result'] = user_db.complete_order(phone, bool(st.session_state.get('use_coupon')))
         st.session_state['use_coupon'] = False # 사용 상태 초기화
-    
-    # 2. 쿠폰 발급 (재방문 시 쿠폰함에 저장)
-    if phone in st.session_state['user_db']:
-        st.session_state['user_db'][phone]['coupons'] += 1
+    if st.session_state.get('order_result'):
+        user, redeemed = st.session_state['order_result']
+        if redeemed:
+            st.warning("🎫 쿠폰 1개가 사용되었습니다.")
         st.success("🎁 주문 감사 쿠폰 1개가 발급되어 쿠폰함에 저장되었습니다!")
-        st.info(f"현재 사용 가능 쿠폰: **{st.session_state['user_db'][phone]['coupons']}개**")
+        st.info(f"현재 사용 가능 쿠폰: **{user['coupons']}개**")
     
     st.markdown("---")
     if st.button("🏠 처음으로 돌아가기"):
@@ -242,6 +260,7 @@ def order_complete_page():
         st.session_state['recommended'] = False
         st.session_state['recommendations'] = []
         st.session_state['use_coupon'] = False
+        st.session_state['order_result'] = None
         set_page('home')
         st.rerun()
 
@@ -1,68 +1,65 @@
 
 # -*- coding: utf-8 -*-
-import time, itertools, datetime as dt, pandas as pd, streamlit as st
-import os
+import streamlit as st
+import os, threading, uuid
+from lucy_core import assets
+from lucy_core.db import gen_order_code, init_db
+from lucy_core.menu import MenuColumnsError, MenuWatcher
+from lucy_core.service import Recommender
+from lucy_core.sessions import SessionStore
 
 st.set_page_config(page_title='Lucy Bakery Menu Recommendation Service (Demo, Routed)', layout='wide')
 
-@st.cache_data
-def load_menu(path: str):
-    df = pd.read_csv(path)
-    req = {"category","name","price","sweetness","tags"}
-    missing = req - set(df.columns)
-    if missing:
-        st.error(f"menu.csv 컬럼 누락: {missing}")
-        st.stop()
-    df["tags_list"] = df["tags"].fillna("").apply(lambda s: [t.strip() for t in s.split(",") if t.strip()])
-    return df
-
-MENU = load_menu("menu.csv")
 BAKERY_CATS = {"빵","샌드위치","샐러드","디저트"}
 SIMPLE_TAGS = ["#달콤한","#짭짤한","#고소한","#바삭한","#촉촉한","#든든한","#가벼운","#초코","#과일"]
 
-def gen_order_code():
-    return f"LUCY-{dt.datetime.now().strftime('%Y%m%d')}-{str(int(time.time()))[-4:]}"
-
-def score_item(row, chosen_tags, target_sweetness):
-    item_tags = set(row["tags_list"])
-    tag_match = len(item_tags & set(chosen_tags))
-    diff = abs(int(row["sweetness"]) - int(target_sweetness))
-    sweet_score = max(0, 3 - diff)
-    return tag_match*3 + sweet_score
-
-def ranked_items(df, chosen_tags, sweet):
-    if df.empty: return df.assign(_score=[])
-    sc = df.apply(lambda r: score_item(r, chosen_tags, sweet), axis=1)
-    return df.assign(_score=sc).sort_values(["_score","price"], ascending=[False, True]).reset_index(drop=True)
-
-def recommend_combos(df, chosen_tags, sweet, budget, topk=3):
-    cand = ranked_items(df, chosen_tags, sweet).head(12)
-    combos, idxs = [], list(cand.index)
-    for r in range(1, 4):
-        for ids in itertools.combinations(idxs, r):
-            items = cand.loc[list(ids)]; total = int(items["price"].sum())
-            if total <= budget:
-                score = float(items["_score"].sum())
-                combos.append((items, total, score, r))
-    if not combos: return []
-    combos.sort(key=lambda x: (-x[2], x[1], -x[3]))
-    out, seen = [], set()
-    for items, total, score, r in combos:
-        sig = tuple(sorted(items["name"].tolist()))
-        if sig in seen: continue
-        seen.add(sig); out.append((items, total, score, r))
-        if len(out) == topk: break
-    return out
+@st.cache_resource
+def load_recommender(path: str):
+    try:
+        rec = Recommender.from_csv(path, popular_bonus=0, cache_size=int(os.environ.get('LUCY_RESULT_CACHE_SIZE', 4096)))
+    except MenuColumnsError as e:
+        st.error(f"menu.csv 컬럼 누락: {e.missing}")
+        st.stop()
+    budgets = [int(b) for b in os.environ.get('LUCY_WARM_BUDGETS', '').split(',') if b]  # e.g. "10000,15000,20000,30000"
+    if budgets:
+        threading.Thread(target=rec.warm, args=(BAKERY_CATS, SIMPLE_TAGS, budgets), name='lucy-warmup', daemon=True).start()
+    live = {'rec': rec}
+    def swap(snap):  # runs on the watcher thread: build + warm the new version, then one assignment
+        new = live['rec'].successor(snap)
+        new.warm(BAKERY_CATS, SIMPLE_TAGS, budgets)
+        live['rec'] = new
+    MenuWatcher(path, swap, float(os.environ.get('LUCY_MENU_RELOAD_INTERVAL', 2)), rec.version).start()
+    return live
+
+REC = load_recommender("menu.csv")['rec']  # one menu version for this whole rerun
+
+@st.cache_resource
+def load_sessions():
+    # kept results/orders of every session, dropped after LUCY_SESSION_IDLE_TTL seconds without a rerun
+    return SessionStore(float(os.environ.get('LUCY_SESSION_IDLE_TTL', 900)), int(os.environ.get('LUCY_MAX_SESSIONS', 2000)))
+
+SESSIONS = load_sessions()
+SID = st.session_state.setdefault('sid', uuid.uuid4().hex)  # session_state itself only holds ids and widget values
+SESSIONS.touch(SID)
+
+MENU_BOARDS = ("menu_board_1.png", "menu_board_2.png")
+
+@st.cache_resource
+def warm_menu_boards(paths):
+    # resize + WebP-encode once at startup; image_variant re-encodes if a file changes later
+    threading.Thread(target=assets.warm, args=(paths,), name='lucy-assets', daemon=True).start()
+
+warm_menu_boards(MENU_BOARDS)
 
 def show_combo(idx, items, total, budget):
     with st.container():
         st.markdown(f"### 세트 {idx} · 합계 **₩{total:,}** / 예산 ₩{int(budget):,}")
         cols = st.columns(min(4, len(items)))
-        for i, (_, r) in enumerate(items.iterrows()):
+        for i, r in enumerate(items):
             with cols[i % len(cols)]:
                 st.markdown(f"- **{r['name']}**")
                 st.caption(f"{r['category']} · ₩{int(r['price']):,}")
-                st.text(', '.join(r['tags_list']) if r['tags_list'] else '-')
+                st.text(', '.join(r['tags']) if r['tags'] else '-')
 
 # ================= UI =================
 st.title("Lucy Bakery Menu Recommendation Service")
@@ -70,23 +67,24 @@ st.title("Lucy Bakery Menu Recommendation Service")
 # --- 주문 완료 화면 (간이 라우팅) ---
 if st.session_state.get("view") == "confirm":
     st.success(f"주문 완료! 주문번호: **{st.session_state.get('order_code','-')}**")
-    total = st.session_state.get("order_total", 0)
-    names = st.session_state.get("order_names", [])
-    if names:
+    order = SESSIONS.get(SID, "order")  # Combo: 메뉴 행 번호만 저장, 표시할 때 메뉴에서 조회
+    items = REC.resolve(order) if order else None
+    if items:
         st.markdown("**주문 내역**")
-        for n in names:
-            st.markdown(f"- {n}")
-    st.markdown(f"**합계**: ₩{int(total):,}")
+        for r in items:
+            st.markdown(f"- {r['name']}")
+    elif order:
+        st.caption("메뉴가 변경되어 주문 내역을 표시할 수 없어요.")
+    st.markdown(f"**합계**: ₩{order.total if order else 0:,}")
     st.caption("※ 발표 버전: 개인정보/DB/쿠폰 기능은 다음 발표에서 제공 예정입니다.")
-    if st.button("처음으로 돌아가기"):
+    if st.button("처음으로 돌아가기", type="primary"):
         st.session_state["view"] = None
         st.session_state["order_code"] = None
-        st.session_state["order_total"] = 0
-        st.session_state["order_names"] = []
+        SESSIONS.pop(SID, "order")
         st.rerun()
     st.stop()
 
-tabs = st.tabs(["베이커리 조합 추천", "음료 추천", "메뉴판 보기"])
+tabs = st.tabs(["베이커리 조합 추천", "음료 추천", "메뉴판 보기"], key="main_tab", on_change="rerun")  # rerun on switch so .open is current
 
 with tabs[0]:
     st.subheader("예산 안에서 가능한 조합 3세트 (1~3개 자동)")
@@ -108,45 +106,59 @@ with tabs[0]:
     soft = st.multiselect("취향 태그(최대 3개)", SIMPLE_TAGS, key='soft', on_change=enforce_max3)
     st.caption(f"선택: {len(soft)}/3")
 
-    if st.button("조합 3세트 추천받기 🍞"):
-        bakery_df = MENU[MENU["category"].isin(BAKERY_CATS)].copy()
-        if bakery_df["price"].min() > budget:
+    if st.button("조합 3세트 추천받기 🍞", type="primary"):
+        SESSIONS.pop(SID, "combos")
+        lowest = REC.min_price(BAKERY_CATS)  # None: no bakery items on the menu
+        if lowest is None or lowest > budget:
             st.warning("예산이 너무 낮아요. 최소 한 개의 품목 가격보다 높게 설정해주세요.")
         else:
-            results = recommend_combos(bakery_df, soft, sweet, int(budget), topk=3)
+            results = REC.combos(BAKERY_CATS, soft, sweet, int(budget), topk=3)
             if not results:
                 st.warning("조건에 맞는 조합을 만들 수 없어요. 예산이나 태그를 조정해보세요.")
             else:
-                for i, (items, total, score, r) in enumerate(results, start=1):
-                    show_combo(i, items, total, budget)
-                    with st.form(key=f'order_form_{i}', clear_on_submit=False):
-                        submit = st.form_submit_button(f"세트 {i} 주문하기 (데모)")
-                        if submit:
-                            oc = gen_order_code()
-                            st.session_state["order_code"] = oc
-                            st.session_state["order_total"] = int(total)
-                            st.session_state["order_names"] = items["name"].tolist()
-                            st.session_state["view"] = "confirm"
-                            st.rerun()
+                SESSIONS.set(SID, "combos", (int(budget), results))  # 주문 버튼을 눌러 다시 실행돼도 유지
+
+    budget_shown, results = SESSIONS.get(SID, "combos", (budget, []))
+    for i, combo in enumerate(results, start=1):
+        items = REC.resolve(combo)
+        if items is None:
+            st.info("메뉴가 변경되었어요. 조합을 다시 추천받아 주세요.")
+            SESSIONS.pop(SID, "combos")
+            break
+        show_combo(i, items, combo.total, budget_shown)
+        with st.form(key=f'order_form_{i}', clear_on_submit=False):
+            submit = st.form_submit_button(f"세트 {i} 주문하기 (데모)")
+            if submit:
+                init_db()  # run-once; the demo only uses its code_sequences, so codes never repeat
+                st.session_state["order_code"] = gen_order_code()
+                SESSIONS.set(SID, "order", combo)
+                st.session_state["view"] = "confirm"
+                st.rerun()
 
 with tabs[1]:
     st.subheader("음료 추천 (카테고리 + 당도)")
     cat = st.selectbox("음료 카테고리", ["커피","라떼","에이드","스무디","티"])
     sweet_d = st.slider("음료 당도 (0~5)", 0, 5, 3, key="drink_sweet")
-    if st.button("음료 추천받기 ☕️"):
-        drink_df = MENU[(MENU["category"] == cat)].copy()
-        ranked = ranked_items(drink_df, [], sweet_d)
+    if st.button("음료 추천받기 ☕️", type="primary"):
+        ranked = REC.ranked_items([cat], [], sweet_d, limit=3)
         st.markdown(f"**{cat} TOP3**")
-        for _, r in ranked.head(3).iterrows():
+        for r in ranked:
             st.markdown(f"- **{r['name']}** · ₩{int(r['price']):,}")
 
 with tabs[2]:
     st.subheader("메뉴판 보기")
-    imgs = [p for p in ["menu_board_1.png","menu_board_2.png"] if os.path.exists(p)]
-    if imgs:
-        st.image(imgs, use_container_width=True, caption=[f"메뉴판 {i+1}" for i in range(len(imgs))])
-    else:
-        st.info("menu_board_1.png, menu_board_2.png 파일을 앱과 같은 폴더에 넣으면 자동 표시됩니다.")
+    if tabs[2].open:  # images only go out while this tab is selected
+        imgs = [p for p in MENU_BOARDS if os.path.exists(p)]
+        if imgs:
+            st.image([assets.image_variant(p) for p in imgs], width="stretch", caption=[f"메뉴판 {i+1}" for i in range(len(imgs))])
+        else:
+            st.info("menu_board_1.png, menu_board_2.png 파일을 앱과 같은 폴더에 넣으면 자동 표시됩니다.")
+
+# --- Admin: 세션별 메모리 (?admin=1) ---
+if st.query_params.get('admin') == '1':
+    with st.sidebar.expander("🧠 세션 메모리 (admin)", expanded=True):
+        st.json(SESSIONS.stats(), expanded=False)
+        st.dataframe(SESSIONS.report(), width="stretch")
 
 st.divider()
 st.caption("© 2025 Lucy Bakery – Demo Version (No Font, Routed)")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Order-placement throughput: pooled connections vs. connect-per-call.
+
+Every worker thread plays one kiosk session: it logs a visit, then places
+orders (order + launch coupon) for its own user. The legacy path is the
+pre-pool code (new sqlite3.connect + commit + close per helper call).
+
+    python bench/bench_db_pool.py --sessions 1 8 32 --orders 200
+"""
+import argparse, datetime as dt, hashlib, json, os, sqlite3, sys, tempfile, threading, time, uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import db as lucy_db
+
+ITEMS = [{"name": "소금빵", "category": "빵", "price": 3200}, {"name": "카페라떼", "category": "라떼", "price": 5000}]
+
+
+def unique_order_code():
+    # the legacy time-based order code collides within one second; keep the comparison about connections
+    return f'LUCY-{dt.datetime.now():%Y%m%d}-{uuid.uuid4().hex[:12].upper()}'
+
+
+# --- legacy helpers (one connection per call) ---
+def legacy_db(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def legacy_log_visit(path, user_id):
+    conn = legacy_db(path); cur = conn.cursor()
+    cur.execute('INSERT INTO visits(user_id, budget, sweetness, tags) VALUES(?,?,?,?)', (user_id, 20000, 2, '#달콤한'))
+    conn.commit(); conn.close()
+
+def legacy_place_order(path, user_id):
+    conn = legacy_db(path); cur = conn.cursor()
+    cur.execute('INSERT INTO orders(user_id, items_json, total_price, order_code) VALUES(?,?,?,?)',
+                (user_id, json.dumps(ITEMS, ensure_ascii=False), 8200, unique_order_code()))
+    conn.commit(); conn.close()
+    conn = legacy_db(path); cur = conn.cursor()
+    cur.execute("SELECT 1 FROM coupons WHERE user_id=? AND kind='launch_cookie' AND status IN ('active','used')", (user_id,))
+    has = cur.fetchone() is not None; conn.close()
+    if not has:
+        code = 'LCK-' + hashlib.sha1(uuid.uuid4().bytes).hexdigest()[:8].upper()
+        conn = legacy_db(path); cur = conn.cursor()
+        cur.execute('INSERT INTO coupons(user_id, code, kind, status) VALUES(?,?,?,?)', (user_id, code, 'launch_cookie', 'active'))
+        conn.commit(); conn.close()
+
+
+# --- pooled helpers ---
+def pooled_log_visit(path, user_id):
+    lucy_db.log_visit(user_id, 20000, 2, ['#달콤한'])
+
+def pooled_place_order(path, user_id):
+    lucy_db.place_order_with_coupon(user_id, ITEMS, 8200)
+
+
+def run(mode, sessions, orders):
+    path = os.path.join(tempfile.mkdtemp(prefix='lucy_bench_'), 'lucy.db')
+    lucy_db.DB_PATH = path
+    lucy_db.init_db()
+    log_visit, place_order = (legacy_log_visit, legacy_place_order) if mode == 'legacy' else (pooled_log_visit, pooled_place_order)
+    errors, done = [], [0] * (sessions + 1)
+
+    def session(user_id):
+        try:
+            log_visit(path, user_id)
+            for _ in range(orders):
+                place_order(path, user_id)
+                done[user_id] += 1
+        except sqlite3.OperationalError as e:  # "database is locked" ends the session, as it would the rerun
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=session, args=(uid,)) for uid in range(1, sessions + 1)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+    lucy_db.get_pool(path).close()
+    done = sum(done)
+    print(f'{mode:7s} sessions={sessions:3d} orders={done:6d} {elapsed:7.2f}s {done / elapsed:9.1f} orders/s errors={len(errors)}')
+    return done / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--sessions', type=int, nargs='+', default=[1, 8, 32, 64])
+    ap.add_argument('--orders', type=int, default=100, help='orders per session')
+    args = ap.parse_args()
+    for n in args.sessions:
+        legacy = run('legacy', n, args.orders)
+        pooled = run('pooled', n, args.orders)
+        print(f'        speedup x{pooled / legacy:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""History streaming and dashboard queries on a large lucy.db.
+
+Seeds --users customers with --orders-per-user orders and visits each (the
+migration 5/6 triggers fill the agg_* and order_items tables as rows go in),
+then:
+
+  stream     iter_orders / iter_visits over the whole history: rows/s and
+             peak Python heap (tracemalloc), which stays at about one page
+  raw        the same dashboard numbers computed by scanning orders/visits
+  agg        lucy_core.analytics reading only the agg_* / order_items tables
+
+    python bench/bench_history.py --users 100000 --orders-per-user 10
+"""
+import argparse, os, sys, tempfile, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import analytics, db as lucy_db
+from synth import seed_history
+
+DAYS = ('2000-01-01', '2999-12-31')
+RAW_TOP_ITEMS = '''SELECT json_extract(j.value, '$.name') AS name, COUNT(*) AS qty FROM orders o,
+  json_each(CASE WHEN json_valid(o.items_json) THEN o.items_json ELSE '[]' END) j GROUP BY name ORDER BY qty DESC LIMIT 10'''
+RAW_ITEM_SALES = '''SELECT COUNT(*), SUM(json_extract(j.value, '$.price')) FROM orders o,
+  json_each(CASE WHEN json_valid(o.items_json) THEN o.items_json ELSE '[]' END) j WHERE json_extract(j.value, '$.name') = ?'''
+RAW_BUDGET_BY_HOUR = "SELECT strftime('%H', created_at) AS hour, COUNT(*), AVG(budget) FROM visits GROUP BY hour"
+RAW_USER_ITEMS = '''SELECT json_extract(j.value, '$.name') AS name, COUNT(*) FROM orders o,
+  json_each(CASE WHEN json_valid(o.items_json) THEN o.items_json ELSE '[]' END) j WHERE o.user_id = ? GROUP BY name'''
+
+
+def stream(label, it):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n = sum(1 for _ in it)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'stream {label:12s} {n:10,d} rows  {n / elapsed:10,.0f} rows/s  peak heap {peak / 1024:8.0f} KiB')
+
+
+def timed(label, fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t0)
+    print(f'{label:28s} {best * 1000:10.3f} ms')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--users', type=int, default=100_000)
+    ap.add_argument('--orders-per-user', type=int, default=10)
+    ap.add_argument('--page-size', type=int, default=analytics.PAGE_SIZE)
+    args = ap.parse_args()
+
+    lucy_db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='lucy_bench_'), 'lucy.db')
+    lucy_db.init_db()
+    t0 = time.perf_counter()
+    with lucy_db.transaction(immediate=True) as conn:
+        seed_history(conn, args.users, args.orders_per_user, args.orders_per_user)
+    print(f'seeded {args.users * args.orders_per_user:,} orders and visits in {time.perf_counter() - t0:.1f}s ({lucy_db.DB_PATH})')
+
+    stream('orders', analytics.iter_orders(page_size=args.page_size))
+    stream('visits', analytics.iter_visits(page_size=args.page_size))
+    stream('orders desc', analytics.iter_orders(newest_first=True, page_size=args.page_size))
+
+    def raw(sql, params=()):
+        with lucy_db.transaction() as conn: conn.execute(sql, params).fetchall()
+    uid = args.users // 2
+    timed('raw top items', lambda: raw(RAW_TOP_ITEMS), repeat=1)
+    timed('agg top items', lambda: analytics.top_items(*DAYS))
+    name = analytics.top_items(*DAYS, limit=1)[0][0]
+    timed('raw item sales (json)', lambda: raw(RAW_ITEM_SALES, (name,)), repeat=1)
+    timed('order_items item sales', lambda: analytics.item_sales(name, *DAYS))
+    timed('raw budget by hour', lambda: raw(RAW_BUDGET_BY_HOUR), repeat=1)
+    timed('agg budget by hour', lambda: analytics.budget_by_hour(*DAYS))
+    timed('agg tag popularity by hour', lambda: analytics.tag_popularity_by_hour(*DAYS))
+    timed('raw user item counts', lambda: raw(RAW_USER_ITEMS, (uid,)))
+    timed('agg user item counts', lambda: analytics.user_item_counts(uid))
+    timed('agg user tag counts', lambda: analytics.user_tag_counts(uid))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Hot lookup latency on a large lucy.db, before and after the index migration.
+
+Seeds --orders orders (default 1M) spread over --users users, plus visits and
+launch coupons, on schema version 1 (no secondary indexes). Times
+fetch_last_order / has_active_launch_coupon, applies the pending migrations,
+times them again and finally runs check_query_plans(), which raises if any hot
+query still scans a table.
+
+    python bench/bench_indexes.py --orders 1000000 --users 50000
+"""
+import argparse, json, os, random, statistics, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import db as lucy_db
+
+ITEMS_JSON = json.dumps([{"name": "소금빵", "category": "빵", "price": 3200}], ensure_ascii=False)
+
+
+def seed(n_orders, n_users, batch=50000):
+    rnd = random.Random(0)
+    with lucy_db.transaction(immediate=True) as conn:
+        for start in range(0, n_orders, batch):
+            stop = min(n_orders, start + batch)
+            conn.executemany('INSERT INTO orders(user_id, items_json, total_price, order_code) VALUES(?,?,?,?)',
+                             ((rnd.randint(1, n_users), ITEMS_JSON, 3200, f'SEED-{i:09d}') for i in range(start, stop)))
+            conn.executemany('INSERT INTO visits(user_id, budget, sweetness, tags) VALUES(?,?,?,?)',
+                             ((rnd.randint(1, n_users), 20000, 2, '#달콤한') for _ in range(start, stop)))
+        conn.executemany("INSERT INTO coupons(user_id, code, kind, status) VALUES(?,?,'launch_cookie','active')",
+                         ((uid, f'LCK-SEED-{uid:08d}') for uid in range(1, n_users + 1, 2)))
+
+
+def time_queries(n_users, samples):
+    rnd = random.Random(1)
+    out = {}
+    for name, fn in (('fetch_last_order', lucy_db.fetch_last_order), ('has_active_launch_coupon', lucy_db.has_active_launch_coupon)):
+        lat = []
+        for _ in range(samples):
+            uid = rnd.randint(1, n_users)
+            t0 = time.perf_counter(); fn(uid); lat.append((time.perf_counter() - t0) * 1000)
+        lat.sort()
+        out[name] = (statistics.median(lat), lat[int(len(lat) * 0.95) - 1])
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--orders', type=int, default=1_000_000)
+    ap.add_argument('--users', type=int, default=50_000)
+    ap.add_argument('--samples', type=int, default=200)
+    args = ap.parse_args()
+
+    lucy_db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='lucy_bench_'), 'lucy.db')
+    lucy_db.init_db(upto=1)
+    t0 = time.perf_counter(); seed(args.orders, args.users)
+    print(f'seeded {args.orders:,} orders in {time.perf_counter() - t0:.1f}s ({lucy_db.DB_PATH})')
+
+    before = time_queries(args.users, max(10, args.samples // 10))  # full scans are slow; fewer samples
+    t0 = time.perf_counter(); lucy_db.init_db()
+    print(f'migrated to schema v{lucy_db.SCHEMA_VERSION} in {time.perf_counter() - t0:.1f}s')
+    after = time_queries(args.users, args.samples)
+    for name in before:
+        (b50, b95), (a50, a95) = before[name], after[name]
+        print(f'{name:26s} p50 {b50:9.3f}ms -> {a50:7.3f}ms   p95 {b95:9.3f}ms -> {a95:7.3f}ms')
+    for name, plan in lucy_db.check_query_plans().items():
+        print(f'plan {name:26s} {"; ".join(plan)}')
+
+
+if __name__ == '__main__':
+    main()
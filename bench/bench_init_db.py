@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Per-rerun schema bootstrap cost: SQL statements executed and wall time.
+
+Simulates --reruns Streamlit reruns against an existing lucy.db:
+
+  legacy    the pre-migration init_db: new connection + executescript
+            (PRAGMA journal_mode=WAL + 4 CREATE TABLE IF NOT EXISTS) per rerun
+  migrate   the migration runner without the process-wide run-once guard
+            (each rerun re-reads schema_migrations)
+  run-once  lucy_core.db.init_db() as the app calls it now
+
+    python bench/bench_init_db.py --reruns 1000
+"""
+import argparse, os, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import db as lucy_db, trace
+
+LEGACY_SCHEMA = '''
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS users(user_id INTEGER PRIMARY KEY AUTOINCREMENT, phone_hash TEXT UNIQUE, consent_at TEXT,
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP, last_seen_at TEXT);
+CREATE TABLE IF NOT EXISTS visits(visit_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, budget INTEGER,
+  sweetness INTEGER, tags TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS orders(order_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, items_json TEXT,
+  total_price INTEGER, order_code TEXT UNIQUE, created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS coupons(coupon_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, code TEXT UNIQUE,
+  kind TEXT, status TEXT, issued_at TEXT DEFAULT CURRENT_TIMESTAMP, expires_at TEXT, meta_json TEXT);
+'''
+
+
+def legacy_init_db(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.set_trace_callback(lambda sql: trace.incr('db.statements'))
+    trace.incr('db.connections_opened')
+    conn.executescript(LEGACY_SCHEMA)
+    conn.commit(); conn.close()
+
+
+def migrate_every_rerun(path):
+    lucy_db._ready.clear()
+    lucy_db.init_db(path)
+
+
+def run(label, fn, path, reruns):
+    trace.reset()
+    t0 = time.perf_counter()
+    for _ in range(reruns): fn(path)
+    elapsed = time.perf_counter() - t0
+    c = trace.counters()
+    print(f'{label:9s} {elapsed / reruns * 1e6:9.1f} us/rerun  {c.get("db.statements", 0) / reruns:6.2f} statements/rerun'
+          f'  {c.get("db.connections_opened", 0):5d} connections opened')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--reruns', type=int, default=1000)
+    args = ap.parse_args()
+    trace.enable()  # before the pool opens connections, so their statements are counted
+    path = os.path.join(tempfile.mkdtemp(prefix='lucy_bench_'), 'lucy.db')
+    lucy_db.init_db(path)  # the database exists and is current, as on every rerun after the first
+    lucy_db.get_pool(path).close()
+    run('legacy', legacy_init_db, path, args.reruns)
+    run('migrate', migrate_every_rerun, path, args.reruns)
+    lucy_db.init_db(path)
+    run('run-once', lucy_db.init_db, path, args.reruns)
+
+
+if __name__ == '__main__':
+    main()
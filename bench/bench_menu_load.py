@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Menu cold start: pandas CSV path vs. compiled snapshot.
+
+Each measurement runs in a fresh interpreter (imports excluded) and reports
+wall time plus peak RSS growth:
+
+  pandas    read_csv + tags split + MenuScorer (the old load_menu path)
+  compile   first start after a CSV change (parse + write the snapshot)
+  snapshot  later starts (mmap the snapshot + MenuScorer.from_snapshot)
+  frame     snapshot + the DataFrame view the Streamlit apps build from it
+
+    python bench/bench_menu_load.py --rows 100000
+"""
+import argparse, json, os, subprocess, sys, tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+from synth import write_synthetic_menu
+
+CHILD = r'''
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[3])
+import pandas as pd
+from lucy_core import MenuScorer
+from lucy_core.menu import load_menu_snapshot
+mode, csv = sys.argv[1], sys.argv[2]
+rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+if mode == 'pandas':
+    df = pd.read_csv(csv)
+    df["tags_list"] = df["tags"].fillna("").apply(lambda s: [t.strip() for t in s.split(",") if t.strip()])
+    scorer = MenuScorer(df)
+else:
+    snap = load_menu_snapshot(csv)
+    scorer = MenuScorer.from_snapshot(snap)
+    if mode == 'frame': snap.frame()
+scorer.score(["#달콤한"], 2)
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0}))
+'''
+
+
+def measure(mode, csv):
+    out = subprocess.run([sys.executable, '-c', CHILD, mode, csv, os.path.join(HERE, '..')],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--rows', type=int, default=100_000)
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args()
+
+    csv = write_synthetic_menu(os.path.join(tempfile.mkdtemp(prefix='lucy_menu_'), 'menu.csv'), args.rows)
+    print(f'{args.rows:,} rows, {os.path.getsize(csv) / 1e6:.1f} MB csv')
+    results = {'pandas': [measure('pandas', csv) for _ in range(args.repeat)], 'compile': [measure('snapshot', csv)]}
+    results['snapshot'] = [measure('snapshot', csv) for _ in range(args.repeat)]
+    results['frame'] = [measure('frame', csv) for _ in range(args.repeat)]
+    for mode, runs in results.items():
+        best = min(runs, key=lambda r: r['seconds'])
+        print(f'{mode:9s} {best["seconds"] * 1000:9.1f} ms   peak RSS +{best["rss_kb"] / 1024:7.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Monthly archival and compaction of a large lucy.db.
+
+Seeds --orders orders and as many visits spread over the last --span-days
+days, then measures before and after ``retention.archive_closed`` +
+``retention.compact``:
+
+  size       lucy.db + WAL bytes, and the archive files written
+  lookups    fetch_last_order for a recent customer (hot database) and a
+             lapsed one (found in an archive), item_sales over the whole span
+  inserts    place_order latency against the hot database
+
+    python bench/bench_retention.py --orders 10000000 --keep-months 3
+"""
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import analytics, db as lucy_db, retention
+from synth import seed_history, synthetic_menu
+
+ITEMS = [{'name': '소금빵', 'category': '빵', 'price': 3500}]
+
+
+def size(path) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def timed(label, fn, repeat=200):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); samples.append(time.perf_counter() - t0)
+    samples.sort()
+    print(f'{label:32s} p50 {samples[len(samples) // 2] * 1e6:9.1f} us   p99 {samples[int(len(samples) * 0.99)] * 1e6:9.1f} us')
+
+
+def lookups(args, name, days):
+    timed('fetch_last_order recent user', lambda: lucy_db.fetch_last_order(args.users))
+    timed('fetch_last_order lapsed user', lambda: lucy_db.fetch_last_order(1), repeat=50)
+    timed('item_sales whole span', lambda: analytics.item_sales(name, *days), repeat=20)
+    timed('place_order', lambda: lucy_db.place_order(args.users, ITEMS, 3500), repeat=500)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--orders', type=int, default=10_000_000)
+    ap.add_argument('--orders-per-user', type=int, default=10)
+    ap.add_argument('--span-days', type=int, default=365)
+    ap.add_argument('--keep-months', type=int, default=3)
+    args = ap.parse_args()
+    args.users = max(args.orders // args.orders_per_user, 1)
+
+    path = lucy_db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='lucy_bench_'), 'lucy.db')
+    lucy_db.init_db()
+    menu = synthetic_menu(200)
+    t0 = time.perf_counter()
+    with lucy_db.transaction(immediate=True) as conn:
+        seed_history(conn, args.users, args.orders_per_user, args.orders_per_user, menu=menu, span_days=args.span_days)
+    print(f'seeded {args.users * args.orders_per_user:,} orders and visits over {args.span_days} days '
+          f'in {time.perf_counter() - t0:.1f}s ({path})')
+    name = menu['name'].iloc[0]
+    days = ('2000-01-01', '2999-12-31')
+    retention.compact(path)  # checkpoint the seeding WAL so both sizes are of settled files
+    before = size(path)
+    print(f'\nbefore: lucy.db + WAL {before / 2**20:10.1f} MiB')
+    sales = analytics.item_sales(name, *days)
+    lookups(args, name, days)
+
+    t0 = time.perf_counter()
+    archived = retention.archive_closed(path, args.keep_months)
+    t1 = time.perf_counter()
+    stats = retention.compact(path, pages=1 << 30)
+    t2 = time.perf_counter()
+    moved = sum(m['orders'] for m in archived.values())
+    arc = sum(os.path.getsize(p) for p in lucy_db.archive_files(path))
+    print(f'\narchived {len(archived)} months, {moved:,} orders in {t1 - t0:.1f}s; compact {t2 - t1:.1f}s {stats}')
+    print(f'after:  lucy.db + WAL {size(path) / 2**20:10.1f} MiB   archives {arc / 2**20:10.1f} MiB')
+    assert analytics.item_sales(name, *days) == sales, 'item_sales changed across archival'
+    lookups(args, name, days)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the recommender and DB hot paths (no Streamlit).
+
+Suites:
+
+  score   MenuScorer.score and Recommender.ranked_items on synthetic menus
+  combos  combo search (uncached) across budgets and candidate-pool sizes,
+          plus a memoized recommend_combos hit and top_combos on hundreds
+          of candidates whose fractional scores rise with price (5 items),
+          up to 1000 near-tied ones that hit its node budget
+  pairs   top_pairs (the dev app's main + bakery search) on n x n items
+  load    menu cold start in a fresh interpreter: CSV parse vs. snapshot mmap
+  db      every lucy_core.db call under 1..64 concurrent worker threads
+          against a seeded history of users, orders, visits and coupons
+
+Menus span 60 to 100k items with uniform and Zipf-skewed tag popularity.
+Every case reports p50/p95/p99/mean latency and throughput; ``run`` writes
+them as JSON, ``compare`` diffs two runs and exits 1 on regressions.
+
+    python bench/harness.py run -o base.json
+    python bench/harness.py run --quick --suite score combos -o new.json
+    python bench/harness.py compare base.json new.json --threshold 0.10
+"""
+import argparse, datetime as dt, json, os, platform, random, subprocess, sys, tempfile, threading, time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+from synth import BASE_TAGS, phone, seed_history, synthetic_menu, write_synthetic_menu
+from lucy_core import db as lucy_db, top_combos, top_pairs
+from lucy_core.menu import MenuSnapshot
+from lucy_core.service import Recommender
+
+SUITES = ('score', 'combos', 'pairs', 'load', 'db')
+FULL = {'sizes': [60, 1000, 10_000, 100_000], 'zipf': [0.0, 1.2], 'budgets': [5000, 20000, 100000],
+        'pools': [12, 24, 48], 'priced_sizes': [100, 200, 400], 'pair_sizes': [100, 1000, 5000], 'workers': [1, 4, 16, 64], 'samples': 300, 'db_ops': 200, 'users': 20000, 'load_repeat': 3}
+QUICK = {'sizes': [60, 1000], 'zipf': [0.0, 1.2], 'budgets': [5000, 20000], 'pools': [12, 24], 'priced_sizes': [100, 200], 'pair_sizes': [100, 1000],
+         'workers': [1, 4], 'samples': 50, 'db_ops': 30, 'users': 1000, 'load_repeat': 1}
+ITEMS = [{"name": "소금빵", "category": "빵", "price": 3200}, {"name": "카페라떼", "category": "라떼", "price": 5000}]
+
+
+def summarize(lat, wall):
+    ms = np.asarray(lat) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]).tolist()
+    return {'n': len(ms), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'mean_ms': float(ms.mean()), 'ops_s': len(ms) / wall}
+
+
+def timed(fn, n, warmup=3):
+    """Call ``fn(i)`` ``n`` times on this thread."""
+    for i in range(warmup): fn(i)
+    lat = []
+    for i in range(n):
+        t0 = time.perf_counter(); fn(i); lat.append(time.perf_counter() - t0)
+    return summarize(lat, sum(lat))
+
+
+def timed_concurrent(fn, workers, n_per_worker):
+    """``workers`` threads released together, each calling ``fn(worker, i)`` ``n_per_worker`` times."""
+    lats = [[] for _ in range(workers)]
+    gate = threading.Barrier(workers + 1)
+
+    def work(w):
+        gate.wait()
+        for i in range(n_per_worker):
+            t0 = time.perf_counter(); fn(w, i); lats[w].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in range(workers)]
+    for t in threads: t.start()
+    gate.wait(); t0 = time.perf_counter()
+    for t in threads: t.join()
+    return summarize([x for lat in lats for x in lat], time.perf_counter() - t0)
+
+
+def queries(n, seed=0):
+    """``n`` (tags, sweetness) inputs like the kiosk sends: 0-3 tags, sweetness 0-5."""
+    rng = random.Random(seed)
+    return [(rng.sample(BASE_TAGS[:9], rng.randint(0, 3)), rng.randint(0, 5)) for _ in range(n)]
+
+
+def menus(cfg):
+    for n in cfg['sizes']:
+        for z in cfg['zipf']:
+            snap = MenuSnapshot.from_frame(synthetic_menu(n, zipf=z), sha1=f'synth-{n}-{z}')
+            yield f'n={n} zipf={z}', Recommender(snap)
+
+
+def suite_score(cfg, report):
+    qs = queries(cfg['samples'])
+    for label, rec in menus(cfg):
+        report(f'score {label}', timed(lambda i: rec.scorer.score(*qs[i % len(qs)]), cfg['samples']))
+        report(f'ranked_items {label}', timed(lambda i: rec.ranked_items(None, *qs[i % len(qs)], limit=12), cfg['samples']))
+
+
+def suite_combos(cfg, report):
+    qs = queries(cfg['samples'])
+    for label, rec in menus(cfg):
+        for budget in cfg['budgets']:
+            for pool in cfg['pools']:
+                report(f'combos {label} budget={budget} pool={pool}',
+                       timed(lambda i: rec._combo_rows(None, *qs[i % len(qs)], budget, 3, pool, 3), cfg['samples']))
+        report(f'recommend_cached {label}', timed(lambda i: rec.recommend_combos(None, *qs[i % 8], 20000), cfg['samples']))
+    rng = np.random.default_rng(0)
+    for n in cfg['priced_sizes']:
+        # the hard shape for the search bound: dearer items score higher, by a fractional margin
+        prices = rng.integers(10, 150, n) * 100
+        scores = prices / 1000 + rng.random(n) * 0.5
+        order = np.lexsort((prices, -scores))
+        for budget in (12000, 30000):
+            report(f'combos priced n={n} budget={budget} items=5',
+                   timed(lambda i: top_combos(prices[order], scores[order], budget, 3, 5), max(5, cfg['samples'] // 10), warmup=1))
+    # 1000 near-tied candidates: an exact search takes ~25 s, so this one ends at MAX_NODES with its best so far
+    rng = np.random.default_rng(1)
+    prices = rng.integers(10, 150, 1000) * 100
+    scores = prices / 1000 + rng.random(1000) * 0.5
+    order = np.lexsort((prices, -scores))
+    report('combos near-tie n=1000 budget=50000 items=5',
+           timed(lambda i: top_combos(prices[order], scores[order], 50000, 3, 5), 5, warmup=1))
+
+
+def suite_pairs(cfg, report):
+    rng = np.random.default_rng(0)
+    for n in cfg['pair_sizes']:
+        pa, pb = rng.integers(30, 150, (2, n)) * 100
+        sa, sb = rng.integers(0, 4, (2, n))
+        for budget in cfg['budgets']:
+            report(f'pairs n={n} budget={budget}',
+                   timed(lambda i: top_pairs(pa, pb, budget, 3, sa, sb, seed=i), max(10, cfg['samples'] // 10)))
+
+
+def suite_load(cfg, report):
+    from bench_menu_load import measure
+    for n in cfg['sizes']:
+        csv = write_synthetic_menu(os.path.join(tempfile.mkdtemp(prefix='lucy_menu_'), 'menu.csv'), n)
+        measure('snapshot', csv)  # compile once so the snapshot runs below are warm starts
+        for mode in ('pandas', 'snapshot'):
+            runs = [measure(mode, csv)['seconds'] for _ in range(cfg['load_repeat'])]
+            report(f'load_menu {mode} n={n}', summarize(runs, sum(runs)))
+
+
+def suite_db(cfg, report):
+    path = os.path.join(tempfile.mkdtemp(prefix='lucy_bench_'), 'lucy.db')
+    lucy_db.DB_PATH = path
+    lucy_db.init_db()
+    users = cfg['users']
+    with lucy_db.transaction(immediate=True) as conn:
+        seed_history(conn, users)
+    fresh = iter(range(users + 1, 10 ** 9))  # users without a launch coupon yet, for the issuing path
+    fresh_lock = threading.Lock()
+
+    def new_user(w, i):
+        with fresh_lock: return next(fresh)
+
+    calls = {
+        'upsert_user': lambda w, i: lucy_db.upsert_user(phone(random.randint(1, users))),
+        'upsert_user_new': lambda w, i: lucy_db.upsert_user(phone(new_user(w, i))),
+        'log_visit': lambda w, i: lucy_db.log_visit(random.randint(1, users), 20000, 2, ['#달콤한']),
+        'fetch_last_order': lambda w, i: lucy_db.fetch_last_order(random.randint(1, users)),
+        'has_active_launch_coupon': lambda w, i: lucy_db.has_active_launch_coupon(random.randint(1, users)),
+        'issue_launch_cookie_coupon': lambda w, i: lucy_db.issue_launch_cookie_coupon(new_user(w, i)),
+        'place_order_with_coupon': lambda w, i: lucy_db.place_order_with_coupon(random.randint(1, users), ITEMS, 8200),
+    }
+    for name, fn in calls.items():
+        for workers in cfg['workers']:
+            report(f'db {name} workers={workers}', timed_concurrent(fn, workers, max(10, cfg['db_ops'] // workers)))
+    lucy_db.get_pool(path).close()
+
+
+def git_rev():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run(args):
+    cfg = dict(QUICK if args.quick else FULL)
+    if args.sizes: cfg['sizes'] = args.sizes
+    if args.workers: cfg['workers'] = args.workers
+    results = {}
+
+    def report(name, stats):
+        results[name] = stats
+        print(f'{name:60s} p50 {stats["p50_ms"]:9.3f}  p95 {stats["p95_ms"]:9.3f}  p99 {stats["p99_ms"]:9.3f} ms'
+              f'  {stats["ops_s"]:11.1f} ops/s', flush=True)
+
+    for suite in args.suite:
+        globals()['suite_' + suite](cfg, report)
+    out = {'meta': {'rev': git_rev(), 'when': dt.datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(), 'machine': platform.platform(), 'cpus': os.cpu_count(),
+                    'suites': args.suite, 'config': cfg},
+           'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(out, f, ensure_ascii=False, indent=1)
+        print(f'wrote {len(results)} cases to {args.output}')
+
+
+def compare(args):
+    with open(args.base, encoding='utf-8') as f: base = json.load(f)
+    with open(args.new, encoding='utf-8') as f: new = json.load(f)
+    regressions = 0
+    for name in sorted(set(base['results']) & set(new['results'])):
+        b, n = base['results'][name], new['results'][name]
+        ratio = n[args.metric] / b[args.metric] if b[args.metric] else float('inf')
+        flag = ''
+        if ratio > 1 + args.threshold and n[args.metric] - b[args.metric] > args.min_delta_ms:
+            flag = 'REGRESSION'; regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = 'faster'
+        print(f'{name:60s} {b[args.metric]:9.3f} -> {n[args.metric]:9.3f} ms  x{ratio:5.2f}  {flag}')
+    for name in sorted(set(base['results']) ^ set(new['results'])):
+        print(f'{name:60s} only in {"base" if name in base["results"] else "new"}')
+    print(f'{regressions} regression(s) on {args.metric} (threshold {args.threshold:.0%})')
+    return 1 if regressions else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    r = sub.add_parser('run', help='run suites and print / save the results')
+    r.add_argument('--suite', nargs='+', choices=SUITES, default=list(SUITES))
+    r.add_argument('--quick', action='store_true', help='small menus, fewer workers and samples')
+    r.add_argument('--sizes', type=int, nargs='+', help='menu sizes (overrides the preset)')
+    r.add_argument('--workers', type=int, nargs='+', help='DB worker counts (overrides the preset)')
+    r.add_argument('-o', '--output', help='write results as JSON')
+    c = sub.add_parser('compare', help='diff two JSON runs; exit 1 on regressions')
+    c.add_argument('base'); c.add_argument('new')
+    c.add_argument('--metric', default='p95_ms', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'])
+    c.add_argument('--threshold', type=float, default=0.10, help='relative slowdown that counts as a regression')
+    c.add_argument('--min-delta-ms', type=float, default=0.05, help='ignore slowdowns smaller than this (timer noise)')
+    args = ap.parse_args()
+    if args.cmd == 'run': run(args)
+    else: sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
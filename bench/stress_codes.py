@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Stress test for order/coupon code generation across a process pool.
+
+Each worker process generates its share of --codes order codes and coupon
+codes against one shared lucy.db. Exits non-zero on any duplicate or any code
+that doesn't match the LUCY-YYYYMMDD-XXXX / LCK-XXXX-XXXX format.
+
+    python bench/stress_codes.py --codes 1000000 --procs 8
+"""
+import argparse, multiprocessing as mp, os, re, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import db as lucy_db
+
+ORDER_RE = re.compile(r'^LUCY-\d{8}-[0-9A-HJKMNP-TV-Z]{4,}$')
+COUPON_RE = re.compile(r'^LCK-[0-9A-HJKMNP-TV-Z]{4}-[0-9A-HJKMNP-TV-Z]{4,}$')
+
+
+def work(args):
+    path, n = args
+    lucy_db.DB_PATH = path
+    return [lucy_db.gen_order_code() for _ in range(n)], [lucy_db.gen_coupon_code() for _ in range(n)]
+
+
+def check(kind, codes, pattern):
+    dupes = len(codes) - len(set(codes))
+    bad = [c for c in codes if not pattern.match(c)]
+    print(f'{kind:7s} {len(codes):,} codes  duplicates={dupes}  malformed={len(bad)}  e.g. {codes[:3]}')
+    return dupes == 0 and not bad
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--codes', type=int, default=1_000_000, help='codes of each kind')
+    ap.add_argument('--procs', type=int, default=os.cpu_count() or 4)
+    ap.add_argument('--chunk', type=int, default=10_000, help='codes per task')
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='lucy_codes_'), 'lucy.db')
+    lucy_db.DB_PATH = path
+    lucy_db.init_db()
+    tasks = [(path, min(args.chunk, args.codes - i)) for i in range(0, args.codes, args.chunk)]
+    orders, coupons = [], []
+    t0 = time.perf_counter()
+    with mp.get_context('spawn').Pool(args.procs) as pool:
+        for o, c in pool.imap_unordered(work, tasks):
+            orders += o; coupons += c
+    elapsed = time.perf_counter() - t0
+    print(f'{2 * args.codes:,} codes in {elapsed:.1f}s with {args.procs} processes ({2 * args.codes / elapsed:,.0f}/s)')
+    ok = check('order', orders, ORDER_RE) & check('coupon', coupons, COUPON_RE)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
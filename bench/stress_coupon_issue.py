@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Concurrency check for launch-coupon issuance.
+
+--threads threads race to issue the launch_cookie coupon for the same users
+(all threads start together on a barrier). Every user must end up with exactly
+one coupon and exactly one thread must have been told it was issued; exits
+non-zero otherwise.
+
+    python bench/stress_coupon_issue.py --threads 64 --users 20
+"""
+import argparse, os, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import db as lucy_db
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--threads', type=int, default=64)
+    ap.add_argument('--users', type=int, default=20)
+    args = ap.parse_args()
+
+    lucy_db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='lucy_coupons_'), 'lucy.db')
+    lucy_db.init_db()
+    barrier = threading.Barrier(args.threads)
+    issued, errors = [], []
+
+    def worker():
+        barrier.wait()
+        for uid in range(1, args.users + 1):
+            try:
+                code, _ = lucy_db.issue_launch_cookie_coupon(uid)
+                if code: issued.append((uid, code))
+            except Exception as e:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+
+    with lucy_db.transaction() as conn:
+        counts = dict(conn.execute("SELECT user_id, COUNT(*) FROM coupons WHERE kind='launch_cookie' GROUP BY user_id").fetchall())
+    per_user = {uid: sum(1 for u, _ in issued if u == uid) for uid in range(1, args.users + 1)}
+    wrong = {uid: (counts.get(uid, 0), per_user[uid]) for uid in per_user if counts.get(uid, 0) != 1 or per_user[uid] != 1}
+    print(f'{args.threads} threads x {args.users} users: {args.threads * args.users} attempts in {elapsed:.2f}s, '
+          f'{len(issued)} issued, errors={len(errors)}, users without exactly one coupon={len(wrong)}')
+    for e in errors[:5]: print('  error:', e)
+    for uid, (rows, acks) in list(wrong.items())[:5]: print(f'  user {uid}: {rows} rows, {acks} issued acks')
+    sys.exit(0 if not wrong and not errors else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Synthetic menus (shaped like menu.csv) and customer histories for benchmarks."""
+import datetime as dt, json
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ["빵", "샌드위치", "샐러드", "디저트", "커피", "라떼", "에이드", "스무디", "티"]
+BASE_TAGS = ["#달콤한", "#짭짤한", "#고소한", "#바삭한", "#촉촉한", "#든든한", "#가벼운", "#초코", "#과일", "#인기"]
+
+
+def synthetic_menu(n: int, n_tags: int = 60, tags_per_item: int = 3, zipf: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    """``n`` items; ``zipf`` > 0 skews tag popularity (a few tags on most items), 0 is uniform."""
+    rng = np.random.default_rng(seed)
+    vocab = BASE_TAGS + [f"#태그{i}" for i in range(max(0, n_tags - len(BASE_TAGS)))]
+    weights = 1.0 / np.arange(1, len(vocab) + 1) ** zipf
+    weights /= weights.sum()
+    k = min(tags_per_item, len(vocab))
+    tags = [",".join(rng.choice(vocab, size=k, replace=False, p=weights)) for _ in range(n)]
+    return pd.DataFrame({
+        "category": rng.choice(CATEGORIES, n),
+        "name": [f"메뉴{i:06d}" for i in range(n)],
+        "price": rng.integers(25, 130, n) * 100,
+        "sweetness": rng.integers(0, 6, n),
+        "tags": tags,
+    })
+
+
+def write_synthetic_menu(path: str, n: int, **kw) -> str:
+    synthetic_menu(n, **kw).to_csv(path, index=False)
+    return path
+
+
+def phone(i: int) -> str:
+    return f"010{i:08d}"
+
+
+def _timestamps(n: int, span_days: int):
+    """``n`` increasing 'YYYY-MM-DD HH:MM:SS' UTC strings over the last ``span_days`` days (ids and times grow together)."""
+    end = dt.datetime.now(dt.timezone.utc).replace(microsecond=0)
+    step = span_days * 86400 / max(n, 1)
+    return [(end - dt.timedelta(seconds=(n - k) * step)).strftime("%Y-%m-%d %H:%M:%S") for k in range(n)]
+
+
+def seed_history(conn, users: int, orders_per_user: int = 5, visits_per_user: int = 5,
+                 coupon_share: float = 0.5, menu: pd.DataFrame = None, seed: int = 0, span_days: int = 0):
+    """Users ``phone(1..users)`` with random orders/visits and launch coupons for ``coupon_share`` of them.
+
+    ``conn`` is an open connection on an ``init_db``-created database; rows are
+    written with ``executemany`` and the caller owns the transaction. With
+    ``span_days`` the orders and visits are spread over that many past days in
+    id order, as the kiosk writes them: low user ids are lapsed customers whose
+    history is all old, high ones ordered recently.
+    """
+    from lucy_core.db import phone_to_hash
+    rng = np.random.default_rng(seed)
+    menu = synthetic_menu(200, seed=seed) if menu is None else menu
+    names, cats, prices = menu["name"].tolist(), menu["category"].tolist(), menu["price"].tolist()
+    conn.executemany("INSERT INTO users(phone_hash, consent_at, last_seen_at) VALUES(?, datetime('now'), datetime('now'))",
+                     ((phone_to_hash(phone(i)),) for i in range(1, users + 1)))
+
+    def orders():
+        for k, uid in enumerate(order_users):
+            picks = rng.choice(len(names), int(rng.integers(1, 4)), replace=False).tolist()
+            items = [{"name": names[j], "category": cats[j], "price": int(prices[j])} for j in picks]
+            row = (uid, json.dumps(items, ensure_ascii=False), sum(i["price"] for i in items), f"SEED-{k:09d}")
+            yield row + (order_times[k],) if span_days else row
+
+    def visits():
+        for k, uid in enumerate(visit_users):
+            row = (uid, int(rng.integers(5, 40)) * 1000, int(rng.integers(0, 6)), "#달콤한")
+            yield row + (visit_times[k],) if span_days else row
+
+    order_users = np.repeat(np.arange(1, users + 1), orders_per_user).tolist()
+    visit_users = np.repeat(np.arange(1, users + 1), visits_per_user).tolist()
+    if span_days:
+        order_times, visit_times = _timestamps(len(order_users), span_days), _timestamps(len(visit_users), span_days)
+    at = ", created_at" if span_days else ""
+    conn.executemany(f"INSERT INTO orders(user_id, items_json, total_price, order_code{at}) VALUES(?,?,?,?{',?' * bool(span_days)})", orders())
+    conn.executemany(f"INSERT INTO visits(user_id, budget, sweetness, tags{at}) VALUES(?,?,?,?{',?' * bool(span_days)})", visits())
+    conn.executemany("INSERT INTO coupons(user_id, code, kind, status) VALUES(?,?,'launch_cookie','active')",
+                     ((uid, f"LCK-SEED-{uid:08d}") for uid in range(1, users + 1) if rng.random() < coupon_share))
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""Streamlit-free core of the Lucy Bakery recommender."""
+from .scoring import POPULAR_TAG, MenuScorer
+from .combos import MAX_COMBO_ITEMS, Combo, top_combos, top_pairs
+from .menu import MenuColumnsError, MenuSnapshot, load_menu_snapshot
+from .index import MenuIndex
+from .service import LucyService, Recommender
+
+__all__ = ["POPULAR_TAG", "MenuScorer", "MAX_COMBO_ITEMS", "Combo", "top_combos", "top_pairs",
+           "MenuColumnsError", "MenuSnapshot", "load_menu_snapshot", "MenuIndex",
+           "LucyService", "Recommender"]
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Order/visit history streams and dashboard queries.
+
+``iter_orders`` / ``iter_visits`` page through the raw history with keyset
+pagination (``WHERE id > last_id ORDER BY id LIMIT n``): each page is one
+short read transaction, so memory stays at one page, writers are never
+blocked for the length of a scan, and page cost does not grow with offset.
+
+Dashboards read the ``agg_*`` tables (migration 5) and ``order_items``
+(migration 6), which triggers update in the same transaction as every order
+and visit insert, so they never parse or scan the raw history.
+
+The aggregates keep counting months that lucy_core.retention has moved to
+archive files; the raw streams read one database (``path``), so pass an
+archive's path to stream an archived month.
+"""
+import datetime as dt, json
+
+from . import db
+from .db import ITEM_SALES_SQL, ORDERS_PAGE_SQL, USER_ITEMS_SQL, USER_TAGS_SQL, VISITS_PAGE_SQL
+
+PAGE_SIZE = 500
+
+
+def _pages(sql, key, user_id, after, newest_first, page_size, path):
+    last = after if after is not None else (2 ** 63 - 1 if newest_first else 0)
+    while True:
+        params = (last, page_size) if user_id is None else (user_id, last, page_size)
+        with db.transaction(path=path) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        yield from rows
+        if len(rows) < page_size: return
+        last = rows[-1][key]
+
+
+def iter_orders(user_id: int = None, after: int = None, newest_first: bool = False,
+                page_size: int = PAGE_SIZE, path: str = None):
+    """Orders (all, or one user's) as dicts with parsed ``items``, ``page_size`` rows per query.
+
+    ``after`` is the last order_id already seen, so an interrupted scan resumes where it stopped.
+    """
+    sql = ORDERS_PAGE_SQL[user_id is not None, newest_first]
+    for r in _pages(sql, 'order_id', user_id, after, newest_first, page_size, path):
+        try:
+            items = json.loads(r['items_json'])
+        except (TypeError, ValueError):
+            items = []
+        yield {'order_id': r['order_id'], 'user_id': r['user_id'], 'items': items, 'total_price': r['total_price'],
+               'order_code': r['order_code'], 'created_at': r['created_at']}
+
+
+def iter_visits(user_id: int = None, after: int = None, newest_first: bool = False,
+                page_size: int = PAGE_SIZE, path: str = None):
+    """Visits as dicts with ``tags`` split into a list; same paging as ``iter_orders``."""
+    sql = VISITS_PAGE_SQL[user_id is not None, newest_first]
+    for r in _pages(sql, 'visit_id', user_id, after, newest_first, page_size, path):
+        yield {'visit_id': r['visit_id'], 'user_id': r['user_id'], 'budget': r['budget'], 'sweetness': r['sweetness'],
+               'tags': [t.strip() for t in (r['tags'] or '').split(',') if t.strip()], 'created_at': r['created_at']}
+
+
+# ----- dashboards / personalization (aggregate tables only) -----
+def user_tag_counts(user_id: int, path: str = None) -> dict:
+    """How often this customer picked each tag."""
+    with db.transaction(path=path) as conn:
+        return {r['tag']: r['n'] for r in conn.execute(USER_TAGS_SQL, (user_id,))}
+
+
+def user_item_counts(user_id: int, path: str = None) -> dict:
+    """How many of each menu item this customer has ordered."""
+    with db.transaction(path=path) as conn:
+        return {r['name']: r['n'] for r in conn.execute(USER_ITEMS_SQL, (user_id,))}
+
+
+def item_sales(name: str, day_from: str, day_to: str, path: str = None) -> tuple:
+    """(units sold, revenue) of one menu item between two ``YYYY-MM-DD`` days (inclusive, UTC), from order_items
+    in lucy.db and in the monthly archives (lucy_core.retention) the range reaches."""
+    until = (dt.date.fromisoformat(day_to) + dt.timedelta(days=1)).isoformat()
+    with db.transaction(path=path) as conn:
+        qty, revenue = conn.execute(ITEM_SALES_SQL, (name, day_from, until)).fetchone()
+    for p in db.archive_files(path, day_from[:7], day_to[:7]):
+        with db.archive_connection(p) as conn:
+            q, r = conn.execute(ITEM_SALES_SQL, (name, day_from, until)).fetchone()
+        qty, revenue = qty + q, revenue + r
+    return qty, revenue
+
+
+def top_items(day_from: str, day_to: str, limit: int = 10, path: str = None) -> list:
+    """Best sellers between two ``YYYY-MM-DD`` days (inclusive, UTC): [(name, qty, revenue)]."""
+    with db.transaction(path=path) as conn:
+        return [tuple(r) for r in conn.execute(
+            'SELECT name, SUM(qty) AS qty, SUM(revenue) AS revenue FROM agg_item_daily WHERE day BETWEEN ? AND ?'
+            ' GROUP BY name ORDER BY qty DESC, revenue DESC, name LIMIT ?', (day_from, day_to, limit))]
+
+
+def budget_by_hour(day_from: str, day_to: str, path: str = None) -> dict:
+    """{hour: (visits, average budget)} over the day range."""
+    with db.transaction(path=path) as conn:
+        return {r['hour']: (r['visits'], r['budget_sum'] / r['visits']) for r in conn.execute(
+            'SELECT hour, SUM(visits) AS visits, SUM(budget_sum) AS budget_sum FROM agg_visits_hourly'
+            ' WHERE day BETWEEN ? AND ? GROUP BY hour ORDER BY hour', (day_from, day_to))}
+
+
+def tag_popularity_by_hour(day_from: str, day_to: str, path: str = None) -> dict:
+    """{hour: {tag: picks}} over the day range."""
+    out = {}
+    with db.transaction(path=path) as conn:
+        for r in conn.execute('SELECT hour, tag, SUM(n) AS n FROM agg_tags_hourly WHERE day BETWEEN ? AND ?'
+                              ' GROUP BY hour, tag ORDER BY hour, n DESC', (day_from, day_to)):
+            out.setdefault(r['hour'], {})[r['tag']] = r['n']
+    return out
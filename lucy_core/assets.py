@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Display-sized, WebP-encoded copies of the menu board images.
+
+The boards are 1191x1684 PNGs (~300 KB together) shown in a tab a few
+hundred pixels wide. ``image_variant`` resizes and re-encodes a file once
+per (mtime, size) and keeps the bytes in a process-wide dict, so every
+session gets the same small payload without touching the PNG again. Pillow
+is optional: without it the original bytes are served (still read once).
+"""
+import io, os, threading
+
+from . import trace
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+MAX_WIDTH = 900
+WEBP_QUALITY = 80
+_variants, _lock = {}, threading.Lock()  # (abspath, width, quality) -> ((mtime_ns, size), bytes)
+
+
+def _encode(path, width, quality) -> bytes:
+    if Image is None:
+        with open(path, "rb") as f:
+            return f.read()
+    with Image.open(path) as im:
+        im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+        if im.width > width:
+            im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+        buf = io.BytesIO()
+        im.save(buf, "WEBP", quality=quality, method=6)
+        return buf.getvalue()
+
+
+@trace.traced('assets.image_variant')
+def image_variant(path: str, width: int = MAX_WIDTH, quality: int = WEBP_QUALITY) -> bytes:
+    """``path`` at most ``width`` px wide as WebP bytes, re-encoded only when the file changes."""
+    st = os.stat(path)
+    key, stamp = (os.path.abspath(path), width, quality), (st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _variants.get(key)
+    if cached is not None and cached[0] == stamp:
+        trace.incr('assets.hit')
+        return cached[1]
+    trace.incr('assets.encode')
+    data = _encode(path, width, quality)
+    with _lock:
+        _variants[key] = (stamp, data)
+    return data
+
+
+def warm(paths, width: int = MAX_WIDTH, quality: int = WEBP_QUALITY) -> int:
+    """Encode every existing file in ``paths`` ahead of the first request; returns how many."""
+    n = 0
+    for p in paths:
+        if os.path.exists(p):
+            image_variant(p, width, quality); n += 1
+    return n
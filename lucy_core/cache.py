@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Process-wide LRU for recommendation results.
+
+The recommender's input space is small (<=3 of 9 tags, sweetness 0-5, budget
+in 1,000 steps), so results are memoized per input and shared by every
+session. Entries belong to one menu version (snapshot SHA-1); switching
+versions drops them all.
+"""
+import threading
+from collections import OrderedDict
+from itertools import combinations
+
+from . import trace
+
+
+def tag_key(tags) -> tuple:
+    """Order-insensitive key for a tag selection (scores only depend on the set)."""
+    return tuple(sorted(set(tags)))
+
+
+def tag_choices(tags, max_tags=3):
+    """Every selection of at most ``max_tags`` of ``tags``, the empty one included."""
+    for k in range(max_tags + 1):
+        yield from combinations(tags, k)
+
+
+class ResultCache:
+    """Thread-safe, size-bounded LRU; ``get`` computes on a miss outside the lock."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.version = None
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_version(self, version):
+        """Bind the cache to a menu version, clearing it if the version changed."""
+        with self._lock:
+            if version != self.version:
+                self._data.clear()
+                self.version = version
+
+    def get(self, key, compute):
+        with self._lock:
+            hit = key in self._data
+            if hit:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = self._data[key]
+            else:
+                self.misses += 1
+                version = self.version
+        if hit:
+            trace.incr('result_cache.hit')
+            return value
+        trace.incr('result_cache.miss')
+        value = compute()
+        with self._lock:
+            if version == self.version:  # computed against a stale menu: hand it back, don't keep it
+                self._data[key] = value
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "version": self.version}
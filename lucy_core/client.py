@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Client for ``lucy_core.server`` with the same methods as LucyService.
+
+One keep-alive HTTP connection per thread (Streamlit runs each session's
+script on its own thread).
+"""
+import http.client, json, threading
+from urllib.parse import urlsplit
+
+from . import trace
+
+
+class ServiceError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class ServiceClient:
+    def __init__(self, base_url: str, timeout: float = 5.0):
+        u = urlsplit(base_url)
+        self.host, self.port, self.timeout = u.hostname, u.port or 80, timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.used = False
+        return conn
+
+    def _call(self, method: str, path: str, payload=None):
+        with trace.span(f"api {path}"):
+            return self._request(method, path, payload)
+
+    def _request(self, method, path, payload):
+        body = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in (0, 1):
+            conn = self._conn()
+            reused = self._local.used
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = json.loads(resp.read() or b"null")
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # the server dropped an idle keep-alive connection before reading the request: reconnect once
+                conn.close(); self._local.conn = None
+                if attempt or not reused: raise
+        self._local.used = True
+        if resp.status != 200:
+            raise ServiceError(resp.status, (data or {}).get("error", resp.reason))
+        return data
+
+    def health(self) -> dict:
+        return self._call("GET", "/health")
+
+    def recommend(self, budget, tags=(), sweetness=2, categories=None, topk=3, user_id=None) -> dict:
+        return self._call("POST", "/recommend", {"budget": int(budget), "tags": list(tags), "sweetness": int(sweetness),
+                                                 "categories": None if categories is None else sorted(categories), "topk": topk,
+                                                 "user_id": user_id})
+
+    def top_items(self, categories=None, tags=(), sweetness=2, limit=3, user_id=None) -> dict:
+        return self._call("POST", "/items", {"categories": None if categories is None else sorted(categories),
+                                             "tags": list(tags), "sweetness": int(sweetness), "limit": limit, "user_id": user_id})
+
+    def login(self, phone: str) -> dict:
+        return self._call("POST", "/login", {"phone": phone})
+
+    def log_visit(self, user_id: int, budget: int, sweetness: int, tags=()) -> dict:
+        return self._call("POST", "/visits", {"user_id": user_id, "budget": int(budget), "sweetness": int(sweetness), "tags": list(tags)})
+
+    def order(self, user_id: int, items: list, total_price: int) -> dict:
+        return self._call("POST", "/orders", {"user_id": user_id, "items": items, "total_price": int(total_price)})
+
+    def last_order(self, user_id: int):
+        return self._call("POST", "/last-order", {"user_id": user_id})
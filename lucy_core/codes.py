@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Collision-free order/coupon codes.
+
+Every code is a sequence number handed out by SQLite (``code_sequences``
+table), so codes are unique across threads and processes. Each process
+reserves numbers in blocks, so the database is hit once per ``block`` codes.
+Numbers go through a bijective scramble before base32 encoding, so consecutive
+orders don't get consecutive-looking codes and coupon codes can't be guessed
+from one another.
+"""
+import os, sqlite3, threading
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32: no I, L, O, U
+
+
+def b32(n: int, width: int) -> str:
+    s = ''
+    while n:
+        n, r = divmod(n, 32)
+        s = ALPHABET[r] + s
+    return s.rjust(width, '0')
+
+
+def scramble(n: int, bits: int) -> int:
+    """Bijection on [0, 2**bits): odd multiply, xorshift, odd multiply."""
+    mask = (1 << bits) - 1
+    n = (n * 0x9E3779B1 + 0x7F4A7C15) & mask
+    n ^= n >> (bits // 2)
+    return (n * 0x85EBCA6B) & mask
+
+
+class SequenceAllocator:
+    """Unique ints per (name, day), reserved from SQLite ``block`` at a time.
+
+    Reservations use the allocator's own connection and commit immediately.
+    They run outside ``_lock``: one thread reserves a key's next block while
+    the others wanting that key wait for it, so a thread handing out numbers
+    never waits behind a reservation. A caller that already holds a write
+    transaction on the same database passes its connection as ``conn`` and
+    never waits on the allocator at all (a reservation may be waiting for that
+    very write lock): when the block is used up, one number is taken on that
+    connection and commits or rolls back with the caller's writes. Generating
+    codes before opening the transaction keeps block reservations.
+    """
+
+    def __init__(self, path: str, block: int = 256):
+        self.path, self.block = path, block
+        self.reservations = 0
+        self._lock = threading.Lock()
+        self._pid, self._conn, self._blocks = None, None, {}
+        self._reserving, self._pending = threading.Lock(), {}  # the reservation connection; key -> Event set when reserved
+
+    def _reserve(self, name, day):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO code_sequences(name, day, next_value) VALUES(?,?,0)', (name, day))
+            end = conn.execute('UPDATE code_sequences SET next_value = next_value + ? WHERE name=? AND day=? RETURNING next_value',
+                               (self.block, name, day)).fetchone()[0]
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        self.reservations += 1
+        return end - self.block, end
+
+    def _take_one(self, conn, name, day):
+        # in the caller's transaction: not cached, since a rollback hands the number out again
+        conn.execute('INSERT OR IGNORE INTO code_sequences(name, day, next_value) VALUES(?,?,0)', (name, day))
+        return conn.execute('UPDATE code_sequences SET next_value = next_value + 1 WHERE name=? AND day=? RETURNING next_value',
+                            (name, day)).fetchone()[0] - 1
+
+    def next(self, name: str, day: str = '', conn=None) -> int:
+        key = (name, day)
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():  # forked: never reuse the parent's blocks, connection or locks
+                    self._pid, self._conn, self._blocks = os.getpid(), None, {}
+                    self._reserving, self._pending = threading.Lock(), {}
+                cur, end = self._blocks.get(key, (0, 0))
+                if cur < end:
+                    self._blocks[key] = (cur + 1, end)
+                    return cur
+                if conn is not None:
+                    pending = None
+                elif key in self._pending:
+                    pending = self._pending[key]
+                else:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            if conn is not None:
+                return self._take_one(conn, name, day)
+            pending.wait()  # another thread is reserving this key's next block
+        try:
+            with self._reserving:
+                cur, end = self._reserve(name, day)
+            with self._lock:
+                self._blocks[key] = (cur + 1, end)
+            return cur
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+
+def order_code(seq: int, date: str) -> str:
+    """``LUCY-YYYYMMDD-XXXX``; past 32**4 orders in a day the suffix grows to 5+ characters."""
+    suffix = b32(scramble(seq, 20), 4) if seq < 1 << 20 else b32(seq, 5)
+    return f'LUCY-{date}-{suffix}'
+
+
+def coupon_code(seq: int, prefix: str = 'LCK') -> str:
+    """``LCK-XXXX-XXXX`` (40 bits, scrambled)."""
+    base = b32(scramble(seq, 40), 8) if seq < 1 << 40 else b32(seq, 9)
+    return f'{prefix}-{base[:4]}-{base[4:]}'
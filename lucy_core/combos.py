@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Budget-constrained top-k combo search.
+
+Candidates are plain price/score arrays in rank order (score desc, price asc).
+The search walks combinations depth-first in lexicographic order and prunes a
+branch when even the best possible completion cannot beat the worst combo kept
+in the bounded top-k heap, or can only tie it at a higher total. A completion
+is bounded by the next scores in rank order (limited by how many of the
+cheapest prices still fit the budget) and by the LP relaxation of the
+remaining knapsack, through its dual with one budget multiplier per search,
+which is the one that bites when scores rise with price. A search that still
+has not finished after ``max_nodes`` candidates (a few hundred near-tied ones
+at 5 items can take seconds) returns the best combos it has found.
+"""
+import heapq
+
+import numpy as np
+
+from . import trace
+
+MAX_COMBO_ITEMS = 5
+LP_AFTER = 2000  # bound calls before a search also uses the LP bound
+MAX_NODES = 100_000  # candidates a search may look at before it returns its best so far
+
+
+class Combo:
+    """One recommended set, compact: menu row ids, total, score and the menu version they index.
+
+    This is what a page keeps between reruns; ``Recommender.resolve`` turns it
+    into item dicts at render time against the shared snapshot.
+    """
+    __slots__ = ("rows", "total", "score", "version")
+
+    def __init__(self, rows, total: int, score: float, version: str = ""):
+        self.rows, self.total, self.score, self.version = tuple(rows), int(total), float(score), version
+
+    def __eq__(self, other):
+        return isinstance(other, Combo) and (self.rows, self.total, self.score, self.version) == \
+            (other.rows, other.total, other.score, other.version)
+
+    def __repr__(self):
+        return f"Combo(rows={self.rows}, total={self.total}, score={self.score:g}, version={self.version[:12]!r})"
+
+
+class _OutOfNodes(Exception):
+    pass
+
+
+def _budget_multiplier(prices, scores, budget, k) -> float:
+    """A ``lam`` near the minimum of the root problem's LP bound ``lam * budget + top-k positive (score - lam * price)``."""
+    paid = prices > 0
+    if budget <= 0 or not paid.any(): return 0.0
+    hi = float((scores[paid] / prices[paid]).max())
+    if hi <= 0: return 0.0
+    lams, k = np.concatenate([[0.0], hi * np.geomspace(1e-4, 1.0, 32)]), min(k, len(prices))
+    for _ in range(2):  # a log grid over [0, best ratio], then a linear one around its best point
+        gains = scores[None, :] - lams[:, None] * prices[None, :]
+        top = -np.partition(-gains, k - 1, axis=1)[:, :k]
+        b = int((lams * budget + np.clip(top, 0, None).sum(axis=1)).argmin())
+        best, lams = lams[b], np.linspace(lams[max(b - 1, 0)], lams[min(b + 1, len(lams) - 1)], 16)
+    return float(best)
+
+
+def top_combos(prices, scores, budget, topk=3, max_items=3, ids=None, max_nodes=MAX_NODES):
+    """Best ``topk`` combos of 1..``max_items`` candidates with total <= ``budget``.
+
+    Combos are ordered by score desc, total asc, item count desc and then by
+    candidate positions, i.e. the same order as sorting every feasible
+    ``itertools.combinations`` tuple. Combos with the same item-id signature
+    (``ids``, defaults to the positions) are returned once.
+    Returns a list of ``(positions, total, score, r)``.
+
+    Best effort past ``max_nodes``: a search that has looked at that many
+    candidates stops and returns the best combos found so far (feasible and
+    in the order above, but maybe not the true top ``topk``), counted as
+    ``combo_search.truncated``. Pools of a few dozen candidates finish long
+    before; hundreds of near-tied ones at 5 items may not.
+    """
+    if not 1 <= max_items <= MAX_COMBO_ITEMS:
+        raise ValueError(f"max_items must be between 1 and {MAX_COMBO_ITEMS}")
+    prices = np.asarray(prices, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    n = len(prices)
+    if n == 0 or topk <= 0: return []
+    if (prices < 0).any():
+        raise ValueError("prices must be non-negative")
+    if (np.diff(scores) > 0).any():
+        raise ValueError("candidates must be sorted by score (desc)")
+    if ids is None: ids = range(n)
+    ids = list(ids)
+    price_l, score_l = prices.tolist(), scores.tolist()
+    # suffix_min[i]: cheapest price among candidates i.. (no extension fits if it exceeds the budget left)
+    suffix_min = np.minimum.accumulate(prices[::-1])[::-1].tolist() + [float("inf")]
+    # cheap_sum[m]: sum of the m cheapest prices overall, a lower bound on the cost of adding m items
+    cheap_sum = [0] + np.cumsum(np.sort(prices)[:max_items]).tolist()
+    # score_cum[i]: prefix sums of scores, so score_cum[i+m] - score_cum[i] is the best m-item extension from i
+    score_cum = [0.0] + np.cumsum(scores).tolist()
+    # gain_l[j] = score - lam * price: for any lam >= 0 an extension from i with at most m items and price
+    # <= left scores at most lam * left + its m largest positive gains (the LP relaxation's dual). Finding
+    # lam costs a few numpy passes, so only searches still running after LP_AFTER bounds pay for it.
+    calls, lam, gain_l = 0, None, None
+    nodes = 0
+    top_gain = {}  # (start, m) -> sum of the m largest positive gains from start
+
+    heap, held = [], {}  # heap keeps the worst combo on top; held maps signature -> its key
+
+    def offer(pos, total, score):
+        sig = tuple(sorted(ids[p] for p in pos))
+        key = (score, -total, len(pos), tuple(-p for p in pos))
+        old = held.get(sig)
+        if old is not None:
+            if key <= old: return
+            heap[:] = [e for e in heap if e[0] != old]; heapq.heapify(heap)
+        elif len(heap) == topk:
+            if key <= heap[0][0]: return
+            del held[heapq.heappop(heap)[-1]]
+        heapq.heappush(heap, (key, pos, total, score, sig)); held[sig] = key
+
+    def bound(start, left, slots):
+        # at most the next scores in rank order (as many as fit by count and by the cheapest prices),
+        # and at most the LP bound, which is the one that bites when scores rise with price
+        m = 0
+        while m < slots and start + m < n and cheap_sum[m + 1] <= left:
+            m += 1
+        by_count = score_cum[start + m] - score_cum[start]
+        nonlocal calls, lam, gain_l
+        if lam is None:
+            calls += 1
+            if calls < LP_AFTER: return by_count
+            lam = _budget_multiplier(prices, scores, budget, max_items)
+            gain_l = (scores - lam * prices).tolist()
+        gains = top_gain.get((start, m))
+        if gains is None:
+            gains = top_gain[start, m] = sum(g for g in heapq.nlargest(m, gain_l[start:]) if g > 0)
+        return min(by_count, lam * left + gains)
+
+    def walk(pos, start, total, score):
+        nonlocal nodes
+        left = budget - total
+        slots = max_items - len(pos)
+        for i in range(start, n):
+            if suffix_min[i] > left: return
+            nodes += 1
+            if nodes > max_nodes: raise _OutOfNodes
+            p = price_l[i]
+            if len(heap) == topk:
+                # best completion of pos + (i, ...) takes the next scores from i; this only shrinks as i grows
+                best = score + bound(i, left, slots)
+                wscore, wtotal = heap[0][0][0], -heap[0][0][1]
+                tol = 1e-9 * (1.0 + abs(wscore))  # the bounds sum floats in another order than the combos
+                if best < wscore - tol: return
+                if best <= wscore:
+                    # a tie needs at least q new items, so it costs at least p + the q-1 cheapest prices
+                    q = 1
+                    while score + score_cum[i + q] - score_cum[i] < wscore - tol: q += 1
+                    if total + p + cheap_sum[q - 1] > wtotal: continue
+            if p > left: continue
+            nxt = pos + (i,)
+            offer(nxt, total + p, score + score_l[i])
+            if slots > 1:
+                walk(nxt, i + 1, total + p, score + score_l[i])
+
+    try:
+        walk((), 0, 0, 0.0)
+    except _OutOfNodes:
+        trace.incr('combo_search.truncated')
+    out = sorted(heap, reverse=True)
+    return [(pos, int(total), float(score), len(pos)) for _, pos, total, score, _ in out]
+
+
+def top_pairs(prices_a, prices_b, budget, topk=3, scores_a=None, scores_b=None, seed=0, chunk_rows=256):
+    """Best ``topk`` pairs of one ``a`` and one ``b`` item with total <= ``budget``.
+
+    Pairs are ordered by score (``scores_a[i] + scores_b[j]``, default 0) desc,
+    total desc (use the budget), then a tie-break drawn from ``seed``, so the
+    same inputs and seed always give the same pairs. Picks are diverse: no item
+    is reused while pairs of unused items remain, then the best remaining pairs
+    fill up. Returns a list of ``(i, j, total, score)``.
+
+    Every pair is checked on a broadcast ``price_a + price_b <= budget`` mask
+    (``chunk_rows`` rows of ``a`` at a time). Only each ``a`` item's ``topk``
+    best feasible ``b`` items are kept: a diverse pick blocks fewer than
+    ``topk`` of them, so the answer is always among these.
+    """
+    pa, pb = np.asarray(prices_a, dtype=np.int64), np.asarray(prices_b, dtype=np.int64)
+    sa = np.zeros(len(pa)) if scores_a is None else np.asarray(scores_a, dtype=np.float64)
+    sb = np.zeros(len(pb)) if scores_b is None else np.asarray(scores_b, dtype=np.float64)
+    if len(pa) == 0 or len(pb) == 0 or topk <= 0: return []
+    rng = np.random.default_rng(seed)
+    ta, tb = rng.random(len(pa)), rng.random(len(pb))
+    ob = np.lexsort((tb, -pb, -sb))  # b in preference order; within one a row this is the pair order
+    pb_o = pb[ob]
+    cand_a, cand_b = [], []
+    for start in range(0, len(pa), chunk_rows):
+        fit = pa[start:start + chunk_rows, None] + pb_o[None, :] <= budget
+        first = fit & (np.cumsum(fit, axis=1, dtype=np.int32) <= topk)
+        r, c = np.nonzero(first)
+        cand_a.append(r + start); cand_b.append(ob[c])
+    a, b = np.concatenate(cand_a), np.concatenate(cand_b)
+    if len(a) == 0: return []
+    score, total = sa[a] + sb[b], pa[a] + pb[b]
+    order = np.lexsort((ta[a] + tb[b], -total, -score)).tolist()
+
+    picked, used_a, used_b = [], set(), set()
+    for k in order:
+        i, j = int(a[k]), int(b[k])
+        if i in used_a or j in used_b: continue
+        picked.append(k); used_a.add(i); used_b.add(j)
+        if len(picked) == topk: break
+    if len(picked) < topk:
+        taken = set(picked)
+        picked += [k for k in order if k not in taken][:topk - len(picked)]
+        picked.sort(key=order.index)
+    return [(int(a[k]), int(b[k]), int(total[k]), float(score[k])) for k in picked]
@@ -0,0 +1,731 @@
+# -*- coding: utf-8 -*-
+"""SQLite layer for lucy.db.
+
+Connections come from a process-wide pool (a module singleton, so it survives
+Streamlit reruns). PRAGMAs are applied once when a connection is opened, and
+``transaction()`` lets several helpers share one BEGIN/COMMIT: a helper called
+inside an open transaction on the same thread joins it instead of committing.
+"""
+import datetime as dt, glob, hashlib, json, os, queue, sqlite3, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+
+from . import codes, trace
+from .writebehind import WriteBehindQueue
+
+DB_PATH = 'lucy.db'
+POOL_SIZE = 8
+USER_CACHE_SIZE = 10000                     # phone hashes remembered by upsert_user
+LAST_SEEN_EVERY = dt.timedelta(minutes=5)   # users.last_seen_at is written at most this often per user
+PRAGMAS = {
+    'synchronous': 'NORMAL',   # WAL + NORMAL: no fsync per commit, still crash-safe
+    'cache_size': -16000,      # 16 MB page cache per connection
+    'mmap_size': 64 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'journal_size_limit': 64 * 1024 * 1024,  # a checkpointed WAL is truncated back to this
+}
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = POOL_SIZE, timeout: float = 30.0):
+        self.path, self.size, self.timeout = path, size, timeout
+        self.opened = 0
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        trace.incr('db.connections_opened')
+        if trace.enabled:  # statement counting is decided per connection, when it is opened
+            conn.set_trace_callback(lambda sql: trace.incr('db.statements'))
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = self.opened < self.size
+            if grow: self.opened += 1
+        if grow:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock: self.opened -= 1
+                raise
+        trace.incr('db.pool_waits')
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f'no free connection to {self.path} after {self.timeout}s') from None
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction: conn.execute('ROLLBACK')
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        """BEGIN/COMMIT on a pooled connection; ROLLBACK if the block raises.
+
+        Use ``immediate=True`` for blocks that write, so the write lock is taken
+        up front (and waited for via busy_timeout) instead of on the first write.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        with self.connection() as conn:
+            trace.incr('db.transactions')
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            self._local.conn, self._local.after_commit = conn, []
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+                for fn in self._local.after_commit: fn()
+            finally:
+                self._local.conn = self._local.after_commit = None
+
+    def current(self):
+        """This thread's open ``transaction()`` connection, or None."""
+        return getattr(self._local, 'conn', None)
+
+    def after_commit(self, fn):
+        """Call ``fn()`` once this thread's open transaction commits; dropped if it rolls back."""
+        self._local.after_commit.append(fn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock: self.opened -= 1
+
+
+_pools, _pools_lock = {}, threading.Lock()
+
+def get_pool(path: str = None) -> ConnectionPool:
+    path = path or DB_PATH
+    with _pools_lock:
+        # a forked child must not share the parent's sqlite connections
+        if path not in _pools or _pools[path].pid != os.getpid():
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+def transaction(immediate: bool = False, path: str = None):
+    return get_pool(path).transaction(immediate)
+
+_writer, _writer_orders = None, False
+
+def enable_write_behind(orders: bool = False, path: str = None, **opts) -> WriteBehindQueue:
+    """Queue visit logs (and ``place_order(ack=False)`` when ``orders``) for a background writer.
+
+    Safe to call on every rerun: the first call starts the writer, later ones return it.
+    ``opts`` go to WriteBehindQueue (flush_ms, flush_rows, maxsize, put_timeout).
+    """
+    global _writer, _writer_orders
+    pool = get_pool(path)
+    with _pools_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue(pool, **opts)
+        _writer_orders = orders
+    return _writer
+
+def disable_write_behind():
+    """Flush and stop the background writer; later writes are synchronous again."""
+    global _writer
+    with _pools_lock:
+        writer, _writer = _writer, None
+    if writer is not None: writer.close()
+
+# SQL expressions for the aggregate triggers, which must never make the INSERT they observe fail:
+# an order's items as a JSON array (no rows unless items_json is a valid array), one item's field
+# or tags (NULL / no rows unless the item is an object), and a visit's comma-joined tags as a JSON
+# array of strings (json_quote escapes quotes and control characters; statements in a trigger
+# cannot use a CTE to split them)
+_ORDER_ITEMS = ("json_each(CASE WHEN json_valid({row}.items_json) THEN"
+                " CASE json_type({row}.items_json) WHEN 'array' THEN {row}.items_json END END)")
+_ITEM_FIELD = "json_extract(CASE {j}.type WHEN 'object' THEN {j}.value END, '$.{field}')"
+_ITEM_TAGS = "json_each(CASE {j}.type WHEN 'object' THEN {j}.value END, '$.tags')"
+_VISIT_TAGS = """json_each('[' || replace(json_quote(CAST(COALESCE({row}.tags, '') AS TEXT)), ',', '","') || ']')"""
+
+
+def _item(j, field):
+    return _ITEM_FIELD.format(j=j, field=field)
+
+
+_TRG_ORDERS_AGG = f'''CREATE TRIGGER IF NOT EXISTS trg_orders_agg AFTER INSERT ON orders BEGIN
+  INSERT INTO agg_item_daily(day, name, qty, revenue)
+    SELECT substr(NEW.created_at, 1, 10), {_item('j', 'name')}, 1, COALESCE({_item('j', 'price')}, 0)
+    FROM {_ORDER_ITEMS.format(row='NEW')} j WHERE {_item('j', 'name')} IS NOT NULL
+    ON CONFLICT(day, name) DO UPDATE SET qty = qty + 1, revenue = revenue + excluded.revenue;
+  INSERT INTO agg_user_items(user_id, name, n)
+    SELECT NEW.user_id, {_item('j', 'name')}, 1
+    FROM {_ORDER_ITEMS.format(row='NEW')} j WHERE NEW.user_id IS NOT NULL AND {_item('j', 'name')} IS NOT NULL
+    ON CONFLICT(user_id, name) DO UPDATE SET n = n + 1;
+END'''
+_TRG_VISITS_AGG = f'''CREATE TRIGGER IF NOT EXISTS trg_visits_agg AFTER INSERT ON visits BEGIN
+  INSERT INTO agg_visits_hourly(day, hour, visits, budget_sum)
+    VALUES(substr(NEW.created_at, 1, 10), CAST(substr(NEW.created_at, 12, 2) AS INTEGER), 1, COALESCE(NEW.budget, 0))
+    ON CONFLICT(day, hour) DO UPDATE SET visits = visits + 1, budget_sum = budget_sum + excluded.budget_sum;
+  INSERT INTO agg_tags_hourly(day, hour, tag, n)
+    SELECT substr(NEW.created_at, 1, 10), CAST(substr(NEW.created_at, 12, 2) AS INTEGER), trim(value), 1
+    FROM {_VISIT_TAGS.format(row='NEW')} WHERE trim(value) != ''
+    ON CONFLICT(day, hour, tag) DO UPDATE SET n = n + 1;
+  INSERT INTO agg_user_tags(user_id, tag, n)
+    SELECT NEW.user_id, trim(value), 1
+    FROM {_VISIT_TAGS.format(row='NEW')} WHERE NEW.user_id IS NOT NULL AND trim(value) != ''
+    ON CONFLICT(user_id, tag) DO UPDATE SET n = n + 1;
+END'''
+# in the INSERT's own transaction, so write-behind batches and bulk loads are covered too
+_TRG_ORDERS_ITEMS = f'''CREATE TRIGGER IF NOT EXISTS trg_orders_items AFTER INSERT ON orders BEGIN
+  INSERT INTO menu_items(name, category)
+    SELECT {_item('j', 'name')}, {_item('j', 'category')}
+    FROM {_ORDER_ITEMS.format(row='NEW')} j WHERE {_item('j', 'name')} IS NOT NULL
+    ON CONFLICT(name) DO NOTHING;
+  INSERT INTO order_items(order_id, line, menu_item_id, price)
+    SELECT NEW.order_id, j.key, m.menu_item_id, COALESCE({_item('j', 'price')}, 0)
+    FROM {_ORDER_ITEMS.format(row='NEW')} j JOIN menu_items m ON m.name = {_item('j', 'name')};
+END'''
+_TRG_ORDERS_TASTE = f'''CREATE TRIGGER IF NOT EXISTS trg_orders_taste AFTER INSERT ON orders WHEN NEW.user_id IS NOT NULL BEGIN
+  INSERT INTO agg_user_order_tags(user_id, tag, n)
+    SELECT NEW.user_id, t.value, 1 FROM {_ORDER_ITEMS.format(row='NEW')} i, {_ITEM_TAGS.format(j='i')} t
+    WHERE t.type = 'text'
+    ON CONFLICT(user_id, tag) DO UPDATE SET n = n + 1;
+END'''
+
+# (version, description, statements); applied in order, each in its own transaction
+MIGRATIONS = [
+    (1, 'base schema', (
+        '''CREATE TABLE IF NOT EXISTS users(
+          user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          phone_hash TEXT UNIQUE,
+          consent_at TEXT,
+          created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+          last_seen_at TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS visits(
+          visit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER,
+          budget INTEGER,
+          sweetness INTEGER,
+          tags TEXT,
+          created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS orders(
+          order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER,
+          items_json TEXT,
+          total_price INTEGER,
+          order_code TEXT UNIQUE,
+          created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS coupons(
+          coupon_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER,
+          code TEXT UNIQUE,
+          kind TEXT,
+          status TEXT,
+          issued_at TEXT DEFAULT CURRENT_TIMESTAMP,
+          expires_at TEXT,
+          meta_json TEXT
+        )''',
+    )),
+    (2, 'indexes for hot lookups', (
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_order ON orders(user_id, order_id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_coupons_user_kind_status ON coupons(user_id, kind, status)',
+        'CREATE INDEX IF NOT EXISTS idx_visits_user_created ON visits(user_id, created_at)',
+    )),
+    (3, 'sequences for order/coupon codes', (
+        '''CREATE TABLE IF NOT EXISTS code_sequences(
+          name TEXT NOT NULL,
+          day TEXT NOT NULL,
+          next_value INTEGER NOT NULL,
+          PRIMARY KEY(name, day)
+        )''',
+    )),
+    (4, 'one live launch_cookie coupon per user', (
+        # earlier check-then-insert races could issue twice: keep the first, re-kind the rest
+        '''UPDATE coupons SET kind='launch_cookie_dup'
+          WHERE kind='launch_cookie' AND status IN ('active','used') AND coupon_id NOT IN (
+            SELECT MIN(coupon_id) FROM coupons WHERE kind='launch_cookie' AND status IN ('active','used') GROUP BY user_id)''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_coupons_launch_cookie ON coupons(user_id) WHERE kind='launch_cookie' AND status IN ('active','used')",
+    )),
+    (5, 'incremental aggregates for analytics', (
+        'CREATE INDEX IF NOT EXISTS idx_visits_user_visit ON visits(user_id, visit_id)',
+        '''CREATE TABLE IF NOT EXISTS agg_item_daily(
+          day TEXT NOT NULL, name TEXT NOT NULL, qty INTEGER NOT NULL, revenue INTEGER NOT NULL,
+          PRIMARY KEY(day, name)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS agg_user_items(
+          user_id INTEGER NOT NULL, name TEXT NOT NULL, n INTEGER NOT NULL,
+          PRIMARY KEY(user_id, name)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS agg_user_tags(
+          user_id INTEGER NOT NULL, tag TEXT NOT NULL, n INTEGER NOT NULL,
+          PRIMARY KEY(user_id, tag)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS agg_visits_hourly(
+          day TEXT NOT NULL, hour INTEGER NOT NULL, visits INTEGER NOT NULL, budget_sum INTEGER NOT NULL,
+          PRIMARY KEY(day, hour)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS agg_tags_hourly(
+          day TEXT NOT NULL, hour INTEGER NOT NULL, tag TEXT NOT NULL, n INTEGER NOT NULL,
+          PRIMARY KEY(day, hour, tag)) WITHOUT ROWID''',
+        # one pass over the existing history; from here on the triggers below keep the tables current
+        f'''INSERT INTO agg_item_daily(day, name, qty, revenue)
+          SELECT substr(o.created_at, 1, 10), {_item('j', 'name')}, COUNT(*), SUM(COALESCE({_item('j', 'price')}, 0))
+          FROM orders o, {_ORDER_ITEMS.format(row='o')} j
+          WHERE {_item('j', 'name')} IS NOT NULL GROUP BY 1, 2''',
+        f'''INSERT INTO agg_user_items(user_id, name, n)
+          SELECT o.user_id, {_item('j', 'name')}, COUNT(*)
+          FROM orders o, {_ORDER_ITEMS.format(row='o')} j
+          WHERE o.user_id IS NOT NULL AND {_item('j', 'name')} IS NOT NULL GROUP BY 1, 2''',
+        f'''INSERT INTO agg_user_tags(user_id, tag, n)
+          SELECT v.user_id, trim(t.value), COUNT(*) FROM visits v, {_VISIT_TAGS.format(row='v')} t
+          WHERE v.user_id IS NOT NULL AND trim(t.value) != '' GROUP BY 1, 2''',
+        '''INSERT INTO agg_visits_hourly(day, hour, visits, budget_sum)
+          SELECT substr(created_at, 1, 10), CAST(substr(created_at, 12, 2) AS INTEGER), COUNT(*), SUM(COALESCE(budget, 0))
+          FROM visits GROUP BY 1, 2''',
+        f'''INSERT INTO agg_tags_hourly(day, hour, tag, n)
+          SELECT substr(v.created_at, 1, 10), CAST(substr(v.created_at, 12, 2) AS INTEGER), trim(t.value), COUNT(*)
+          FROM visits v, {_VISIT_TAGS.format(row='v')} t WHERE trim(t.value) != '' GROUP BY 1, 2, 3''',
+        _TRG_ORDERS_AGG,
+        _TRG_VISITS_AGG,
+    )),
+    (6, 'normalized order_items', (
+        '''CREATE TABLE IF NOT EXISTS menu_items(
+          menu_item_id INTEGER PRIMARY KEY,
+          name TEXT UNIQUE NOT NULL,
+          category TEXT
+        )''',
+        # one row per order line; price is what was charged, not the current menu price
+        '''CREATE TABLE IF NOT EXISTS order_items(
+          order_id INTEGER NOT NULL,
+          line INTEGER NOT NULL,
+          menu_item_id INTEGER NOT NULL,
+          price INTEGER NOT NULL,
+          PRIMARY KEY(order_id, line)) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_item ON order_items(menu_item_id, order_id)',
+        f'''INSERT INTO menu_items(name, category)
+          SELECT {_item('j', 'name')}, MIN({_item('j', 'category')})
+          FROM orders o, {_ORDER_ITEMS.format(row='o')} j
+          WHERE {_item('j', 'name')} IS NOT NULL GROUP BY 1 ORDER BY MIN(o.order_id)''',
+        f'''INSERT INTO order_items(order_id, line, menu_item_id, price)
+          SELECT o.order_id, j.key, m.menu_item_id, COALESCE({_item('j', 'price')}, 0)
+          FROM orders o, {_ORDER_ITEMS.format(row='o')} j JOIN menu_items m ON m.name = {_item('j', 'name')}''',
+        _TRG_ORDERS_ITEMS,
+    )),
+    (7, 'per-user tag counts of ordered items', (
+        # LucyService.order stores each item's menu tags in items_json; older orders have none to count
+        '''CREATE TABLE IF NOT EXISTS agg_user_order_tags(
+          user_id INTEGER NOT NULL, tag TEXT NOT NULL, n INTEGER NOT NULL,
+          PRIMARY KEY(user_id, tag)) WITHOUT ROWID''',
+        f'''INSERT INTO agg_user_order_tags(user_id, tag, n)
+          SELECT o.user_id, t.value, COUNT(*) FROM orders o, {_ORDER_ITEMS.format(row='o')} i, {_ITEM_TAGS.format(j='i')} t
+          WHERE o.user_id IS NOT NULL AND t.type = 'text' GROUP BY 1, 2''',
+        _TRG_ORDERS_TASTE,
+    )),
+    (8, 'kiosk check-in counter', (
+        'ALTER TABLE users ADD COLUMN visit_count INTEGER NOT NULL DEFAULT 0',
+    )),
+    (9, 'aggregate triggers that never fail their INSERT', (
+        # 5/6 installed versions that aborted on a control character in a tag or a non-object order item
+        'DROP TRIGGER IF EXISTS trg_orders_agg', 'DROP TRIGGER IF EXISTS trg_visits_agg', 'DROP TRIGGER IF EXISTS trg_orders_items',
+        _TRG_ORDERS_AGG, _TRG_VISITS_AGG, _TRG_ORDERS_ITEMS,
+    )),
+    (10, 'taste trigger that never fails its INSERT', (
+        # 7 installed a version that aborted on an order item that is not an object
+        'DROP TRIGGER IF EXISTS trg_orders_taste', _TRG_ORDERS_TASTE,
+    )),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_ready, _init_lock = {}, threading.Lock()  # (path, pid) -> schema version this process has seen applied
+
+def schema_version(path: str = None) -> int:
+    """Highest applied migration (0 for a new database); a single read, no write lock."""
+    with get_pool(path).connection() as conn:
+        try:
+            return conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()[0] or 0
+        except sqlite3.OperationalError:  # no schema_migrations table yet
+            return 0
+
+@trace.traced('db.init_db')
+def init_db(path: str = None, upto: int = None):
+    """Create/upgrade the schema by applying pending MIGRATIONS (up to ``upto``).
+
+    Run-once per process and path: repeat calls return without touching the
+    database, and the first call on an up-to-date database is one read.
+    """
+    path = path or DB_PATH
+    target = SCHEMA_VERSION if upto is None else min(upto, SCHEMA_VERSION)
+    key = (path, os.getpid())
+    if _ready.get(key, -1) >= target: return
+    with _init_lock:
+        if _ready.get(key, -1) >= target: return
+        if schema_version(path) < target:
+            _migrate(path, target)
+        _ready[key] = target
+
+def _migrate(path, target):
+    with get_pool(path).connection() as conn:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')  # takes effect on a new file only (see lucy_core.retention)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations(
+          version INTEGER PRIMARY KEY,
+          description TEXT,
+          applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''')
+        for version, desc, statements in MIGRATIONS:
+            if version > target: break
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # re-checked under the write lock so concurrent processes apply each migration once
+                if conn.execute('SELECT 1 FROM schema_migrations WHERE version=?', (version,)).fetchone():
+                    conn.execute('COMMIT'); continue
+                for sql in statements:
+                    conn.execute(sql)
+                conn.execute('INSERT INTO schema_migrations(version, description) VALUES(?,?)', (version, desc))
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+# hot queries, kept as constants so every call reuses the connection's cached prepared statement
+USER_BY_PHONE_SQL = 'SELECT user_id FROM users WHERE phone_hash=?'
+UPSERT_USER_SQL = '''INSERT INTO users(phone_hash, consent_at, last_seen_at) VALUES(?,?,?)
+  ON CONFLICT(phone_hash) DO UPDATE SET last_seen_at=excluded.last_seen_at RETURNING user_id'''
+TOUCH_USER_SQL = 'UPDATE users SET last_seen_at=? WHERE user_id=?'
+USER_EXISTS_SQL = 'SELECT 1 FROM users WHERE user_id=?'
+LAUNCH_COUPON_SQL = "SELECT 1 FROM coupons WHERE user_id=? AND kind='launch_cookie' AND status IN ('active','used')"
+LAST_ORDER_SQL = 'SELECT order_id, created_at FROM orders WHERE user_id=? ORDER BY order_id DESC LIMIT 1'
+USER_ORDERED_SQL = 'SELECT 1 FROM agg_user_items WHERE user_id=? LIMIT 1'
+ORDER_LINES_SQL = '''SELECT m.name, m.category, oi.price FROM order_items oi JOIN menu_items m ON m.menu_item_id = oi.menu_item_id
+  WHERE oi.order_id=? ORDER BY oi.line'''
+# units sold and revenue of one menu item over [since, until) (created_at strings, e.g. '2024-05-01')
+ITEM_SALES_SQL = '''SELECT COUNT(*) AS qty, COALESCE(SUM(oi.price), 0) AS revenue
+  FROM order_items oi JOIN orders o ON o.order_id = oi.order_id
+  WHERE oi.menu_item_id = (SELECT menu_item_id FROM menu_items WHERE name=?) AND o.created_at >= ? AND o.created_at < ?'''
+# keyset pages for lucy_core.analytics, keyed by (one user only, newest first)
+ORDERS_PAGE_SQL = {
+    (False, False): 'SELECT * FROM orders WHERE order_id > ? ORDER BY order_id LIMIT ?',
+    (False, True): 'SELECT * FROM orders WHERE order_id < ? ORDER BY order_id DESC LIMIT ?',
+    (True, False): 'SELECT * FROM orders WHERE user_id = ? AND order_id > ? ORDER BY order_id LIMIT ?',
+    (True, True): 'SELECT * FROM orders WHERE user_id = ? AND order_id < ? ORDER BY order_id DESC LIMIT ?',
+}
+VISITS_PAGE_SQL = {
+    (False, False): 'SELECT * FROM visits WHERE visit_id > ? ORDER BY visit_id LIMIT ?',
+    (False, True): 'SELECT * FROM visits WHERE visit_id < ? ORDER BY visit_id DESC LIMIT ?',
+    (True, False): 'SELECT * FROM visits WHERE user_id = ? AND visit_id > ? ORDER BY visit_id LIMIT ?',
+    (True, True): 'SELECT * FROM visits WHERE user_id = ? AND visit_id < ? ORDER BY visit_id DESC LIMIT ?',
+}
+USER_TAGS_SQL = 'SELECT tag, n FROM agg_user_tags WHERE user_id = ?'
+USER_ITEMS_SQL = 'SELECT name, n FROM agg_user_items WHERE user_id = ?'
+USER_RECORD_SQL = 'SELECT user_id, visit_count FROM users WHERE phone_hash=?'
+THANKS_COUPONS_SQL = "SELECT COUNT(*) FROM coupons WHERE user_id=? AND kind='order_thanks' AND status='active'"
+# tags picked on visits + tags of ordered items: the input of lucy_core.taste
+TASTE_SQL = 'SELECT tag, n FROM agg_user_tags WHERE user_id = ? UNION ALL SELECT tag, n FROM agg_user_order_tags WHERE user_id = ?'
+HOT_QUERIES = {
+    'user_by_phone': (USER_BY_PHONE_SQL, ('',)),
+    'touch_user': (TOUCH_USER_SQL, ('', 0)),
+    'user_exists': (USER_EXISTS_SQL, (0,)),
+    'has_active_launch_coupon': (LAUNCH_COUPON_SQL, (0,)),
+    'fetch_last_order': (LAST_ORDER_SQL, (0,)),
+    'fetch_last_order lines': (ORDER_LINES_SQL, (0,)),
+    'user_has_ordered': (USER_ORDERED_SQL, (0,)),
+    'item_sales': (ITEM_SALES_SQL, ('', '', '')),
+    **{f'orders page {k}': (sql, (0,) * sql.count('?')) for k, sql in ORDERS_PAGE_SQL.items()},
+    **{f'visits page {k}': (sql, (0,) * sql.count('?')) for k, sql in VISITS_PAGE_SQL.items()},
+    'user_tag_counts': (USER_TAGS_SQL, (0,)),
+    'user_item_counts': (USER_ITEMS_SQL, (0,)),
+    'fetch_taste_counts': (TASTE_SQL, (0, 0)),
+    'fetch_user_record': (USER_RECORD_SQL, ('',)),
+    'thanks coupons': (THANKS_COUPONS_SQL, (0,)),
+}
+
+def check_query_plans(path: str = None) -> dict:
+    """EXPLAIN QUERY PLAN every hot query; raise RuntimeError if one scans a table or sorts in a temp b-tree.
+
+    Uses a fresh connection: EXPLAIN never reads the file, so a pooled one would keep
+    planning with the schema it cached (and miss an index dropped since).
+    """
+    plans, bad = {}, []
+    conn = sqlite3.connect(path or DB_PATH)
+    try:
+        for name, (sql, params) in HOT_QUERIES.items():
+            plans[name] = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+            if any(d.startswith('SCAN') or 'TEMP B-TREE' in d for d in plans[name]):
+                bad.append(f'{name}: {"; ".join(plans[name])}')
+    finally:
+        conn.close()
+    if bad:
+        raise RuntimeError('hot queries without an index: ' + ' | '.join(bad))
+    return plans
+
+def phone_to_hash(phone: str, salt: str='lucy_salt_v1') -> str:
+    return hashlib.sha256((salt + phone).encode('utf-8')).hexdigest()
+
+# (db path, phone hash) -> (user_id, when last_seen_at was last written), most recent last
+_user_ids, _user_ids_lock = OrderedDict(), threading.Lock()
+
+def _remember_user(key, uid, seen):
+    with _user_ids_lock:
+        _user_ids[key] = (uid, seen)
+        _user_ids.move_to_end(key)
+        while len(_user_ids) > USER_CACHE_SIZE:
+            _user_ids.popitem(last=False)
+
+def clear_user_cache():
+    """Forget every remembered phone (e.g. after deleting users behind upsert_user's back)."""
+    with _user_ids_lock:
+        _user_ids.clear()
+
+@trace.traced('db.upsert_user')
+def upsert_user(phone: str):
+    """user_id of ``phone``, registering it on first sight, in one INSERT ... ON CONFLICT statement.
+
+    A phone whose last_seen_at was written within LAST_SEEN_EVERY is answered from
+    an in-process LRU without touching the disk; after that one UPDATE by user_id
+    refreshes it (queued with the visit logs when write-behind is on). The LRU
+    learns a mapping only when the transaction that wrote it commits, and drops
+    it when the user row turns out to be gone.
+    """
+    ph = phone_to_hash(phone)
+    key, now = (DB_PATH, ph), dt.datetime.utcnow()
+    with _user_ids_lock:
+        hit = _user_ids.get(key)
+        if hit is not None: _user_ids.move_to_end(key)
+    if hit is not None:
+        uid, seen = hit
+        if now - seen < LAST_SEEN_EVERY:
+            trace.incr('db.user_cache.hit')
+            return uid
+        with transaction(immediate=_writer is None) as conn:
+            if _writer is None:
+                alive = conn.execute(TOUCH_USER_SQL, (now.isoformat(), uid)).rowcount > 0
+            else:  # the queued UPDATE cannot say whether the row is still there
+                alive = conn.execute(USER_EXISTS_SQL, (uid,)).fetchone() is not None
+                if alive: _writer.submit(TOUCH_USER_SQL, (now.isoformat(), uid))
+            if alive: get_pool().after_commit(partial(_remember_user, key, uid, now))
+        if alive: return uid
+        with _user_ids_lock:  # deleted behind the cache's back: register the phone again
+            _user_ids.pop(key, None)
+    trace.incr('db.user_cache.miss')
+    # a conflicting upsert still takes an AUTOINCREMENT value: harmless gaps in user_id, hence the cache
+    with transaction(immediate=True) as conn:
+        uid = conn.execute(UPSERT_USER_SQL, (ph, now.isoformat(), now.isoformat())).fetchone()[0]
+        # remembered only once committed: an enclosing transaction that rolls back takes the row with it
+        get_pool().after_commit(partial(_remember_user, key, uid, now))
+    return uid
+
+VISIT_SQL = 'INSERT INTO visits(user_id, budget, sweetness, tags) VALUES(?,?,?,?)'
+ORDER_SQL = 'INSERT INTO orders(user_id, items_json, total_price, order_code) VALUES(?,?,?,?)'
+
+@trace.traced('db.log_visit')
+def log_visit(user_id: int, budget: int, sweetness: int, tags_list: list, on_commit=None):
+    """Insert a visit; ``on_commit()`` runs once it is committed (with write-behind, on the writer thread)."""
+    params = (user_id, budget, sweetness, ",".join(tags_list))
+    if _writer is not None:
+        _writer.submit(VISIT_SQL, params, on_commit); return
+    with transaction(immediate=True) as conn:
+        conn.execute(VISIT_SQL, params)
+        if on_commit is not None: get_pool().after_commit(on_commit)
+
+_allocators = {}
+
+def get_allocator(path: str = None) -> codes.SequenceAllocator:
+    path = path or DB_PATH
+    with _pools_lock:
+        if path not in _allocators:
+            _allocators[path] = codes.SequenceAllocator(path)
+        return _allocators[path]
+
+def gen_order_code():
+    """Unique per day across processes. Best called before opening a write transaction;
+    inside one the number is taken on this thread's connection (see SequenceAllocator)."""
+    date = dt.datetime.now().strftime('%Y%m%d')
+    return codes.order_code(get_allocator().next('order', date, conn=get_pool().current()), date)
+
+@trace.traced('db.place_order')
+def place_order(user_id: int, items, total_price: int, ack: bool = True, order_code: str = None):
+    """Insert an order and return its code. With ``ack=False`` and write-behind
+    orders enabled the row is queued, so the code may be returned before commit."""
+    order_code = order_code or gen_order_code()
+    params = (user_id, json.dumps(items, ensure_ascii=False), total_price, order_code)
+    if not ack and _writer is not None and _writer_orders:
+        _writer.submit(ORDER_SQL, params); return order_code
+    with transaction(immediate=True) as conn:
+        conn.execute(ORDER_SQL, params)
+    return order_code
+
+@trace.traced('db.has_active_launch_coupon')
+def has_active_launch_coupon(user_id: int) -> bool:
+    with transaction() as conn:
+        row = conn.execute(LAUNCH_COUPON_SQL, (user_id,)).fetchone()
+    return row is not None
+
+def gen_coupon_code(prefix='LCK'):
+    return codes.coupon_code(get_allocator().next('coupon', conn=get_pool().current()), prefix)
+
+ISSUE_LAUNCH_COUPON_SQL = '''
+  INSERT INTO coupons(user_id, code, kind, status, expires_at, meta_json)
+  VALUES(?,?,'launch_cookie','active',?,?)
+  ON CONFLICT(user_id) WHERE kind='launch_cookie' AND status IN ('active','used') DO NOTHING
+  RETURNING code, expires_at
+'''
+
+@trace.traced('db.issue_launch_cookie_coupon')
+def issue_launch_cookie_coupon(user_id: int, days_valid: int=14, code: str = None):
+    """One idempotent INSERT: the partial unique index lets only the first issuance per user through."""
+    code = code or gen_coupon_code()
+    expires = (dt.datetime.utcnow() + dt.timedelta(days=days_valid)).date().isoformat()
+    meta = {"desc": "앱 론칭 기념 쿠키 1개 무료", "limit": "매장 내 사용, 1회"}
+    with transaction(immediate=True) as conn:
+        row = conn.execute(ISSUE_LAUNCH_COUPON_SQL, (user_id, code, expires, json.dumps(meta, ensure_ascii=False))).fetchone()
+    if row is None: return None, None
+    return row['code'], row['expires_at']
+
+@trace.traced('db.place_order_with_coupon')
+def place_order_with_coupon(user_id: int, items, total_price: int):
+    """Order + launch coupon in one transaction. Returns (order_code, coupon_code, expires)."""
+    order_code, coupon = gen_order_code(), gen_coupon_code()  # before BEGIN IMMEDIATE: may reserve a new block
+    with transaction(immediate=True):
+        place_order(user_id, items, total_price, order_code=order_code)
+        code, expires = issue_launch_cookie_coupon(user_id, code=coupon)
+    return order_code, code, expires
+
+def archive_dir(path: str = None) -> str:
+    """Where lucy_core.retention puts the monthly archives of ``path`` (lucy.db -> lucy-archive/)."""
+    return os.path.splitext(path or DB_PATH)[0] + '-archive'
+
+# archive dir -> (its mtime_ns, archive files newest first): a new month's file changes the mtime
+_archives, _archives_lock = {}, threading.Lock()
+# (archive dir, user_id) -> (the dir's mtime_ns, fetch_last_order's answer from the archives), most recent last
+_archived_last = OrderedDict()
+
+def _archive_list(path):
+    d = archive_dir(path)
+    try:
+        stamp = os.stat(d).st_mtime_ns
+    except FileNotFoundError:
+        return None, []
+    with _archives_lock:
+        cached = _archives.get(d)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, sorted(glob.glob(os.path.join(d, '????-??.db')), reverse=True))
+        with _archives_lock: _archives[d] = cached
+    return cached
+
+def archive_files(path: str = None, first: str = None, last: str = None) -> list:
+    """Monthly archives (``YYYY-MM.db``) of ``path``, newest first; ``first``/``last`` ('YYYY-MM') limit the months."""
+    return [f for f in _archive_list(path)[1] if (first or '') <= os.path.basename(f)[:7] <= (last or '9999')]
+
+@contextmanager
+def archive_connection(path: str):
+    """A short-lived, read-only connection to one monthly archive. Archives are not pooled:
+    there are many of them, each read rarely."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only=ON')
+        yield conn
+    finally:
+        conn.close()
+
+def _last_order_in(conn, user_id):
+    row = conn.execute(LAST_ORDER_SQL, (user_id,)).fetchone()
+    if not row: return None
+    return [dict(r) for r in conn.execute(ORDER_LINES_SQL, (row['order_id'],))], row['created_at']
+
+def _last_archived_order(user_id):
+    stamp, files = _archive_list(None)
+    if not files: return None
+    key = (archive_dir(), user_id)
+    with _archives_lock:
+        hit = _archived_last.get(key)
+        if hit is not None: _archived_last.move_to_end(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    last = None
+    for path in files:
+        with archive_connection(path) as conn:
+            last = _last_order_in(conn, user_id)
+        if last is not None: break
+    with _archives_lock:
+        _archived_last[key] = (stamp, last)
+        while len(_archived_last) > USER_CACHE_SIZE:
+            _archived_last.popitem(last=False)
+    return last
+
+@trace.traced('db.fetch_last_order')
+def fetch_last_order(user_id: int):
+    """(items, created_at) of the customer's latest order: lucy.db first, then the archives newest first.
+
+    Customers who never ordered (no agg_user_items rows, which archival leaves in
+    place) skip the archives, and an archive answer is remembered until the set of
+    archives changes, so a rerun does not reopen them.
+    """
+    with transaction() as conn:
+        last = _last_order_in(conn, user_id)
+        if last is not None or not conn.execute(USER_ORDERED_SQL, (user_id,)).fetchone():
+            return last
+    return _last_archived_order(user_id)
+
+@trace.traced('db.fetch_taste_counts')
+def fetch_taste_counts(user_id: int) -> dict:
+    """{tag: count} over the customer's visits and orders, from the trigger-maintained aggregates."""
+    counts = {}
+    with transaction() as conn:
+        for r in conn.execute(TASTE_SQL, (user_id, user_id)):
+            counts[r['tag']] = counts.get(r['tag'], 0) + r['n']
+    return counts
+
+# ----- kiosk check-ins and order-thanks coupons (lucy_core.userstore.SQLiteBackend) -----
+def _user_record(conn, user_id, visits):
+    return {'user_id': user_id, 'visits': visits, 'coupons': conn.execute(THANKS_COUPONS_SQL, (user_id,)).fetchone()[0]}
+
+@trace.traced('db.fetch_user_record')
+def fetch_user_record(phone: str):
+    """{'user_id', 'visits', 'coupons'} of a registered phone, else None."""
+    with transaction() as conn:
+        row = conn.execute(USER_RECORD_SQL, (phone_to_hash(phone),)).fetchone()
+        return _user_record(conn, row['user_id'], row['visit_count']) if row else None
+
+@trace.traced('db.record_check_in')
+def record_check_in(phone: str):
+    """Register or re-count a phone at the kiosk. Returns (record, is_new)."""
+    with transaction(immediate=True) as conn:
+        new = conn.execute(USER_BY_PHONE_SQL, (phone_to_hash(phone),)).fetchone() is None
+        uid = upsert_user(phone)
+        visits = conn.execute('UPDATE users SET visit_count = visit_count + 1 WHERE user_id=? RETURNING visit_count',
+                              (uid,)).fetchone()[0]
+        return _user_record(conn, uid, visits), new
+
+@trace.traced('db.complete_thanks_order')
+def complete_thanks_order(user_id: int, use_coupon: bool, days_valid: int = 30):
+    """Redeem one active order_thanks coupon (if asked and available) and issue a new one, in one
+    transaction. Returns (record, redeemed)."""
+    code = gen_coupon_code('THX')  # before BEGIN IMMEDIATE: may reserve a new block
+    expires = (dt.datetime.utcnow() + dt.timedelta(days=days_valid)).date().isoformat()
+    with transaction(immediate=True) as conn:
+        redeemed = use_coupon and conn.execute(
+            """UPDATE coupons SET status='used' WHERE coupon_id = (SELECT MIN(coupon_id) FROM coupons
+                 WHERE user_id=? AND kind='order_thanks' AND status='active') RETURNING coupon_id""",
+            (user_id,)).fetchone() is not None
+        conn.execute("INSERT INTO coupons(user_id, code, kind, status, expires_at) VALUES(?,?,'order_thanks','active',?)",
+                     (user_id, code, expires))
+        visits = conn.execute('SELECT visit_count FROM users WHERE user_id=?', (user_id,)).fetchone()[0]
+        return _user_record(conn, user_id, visits), redeemed
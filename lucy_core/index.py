@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Category partitions and tag posting lists over a MenuSnapshot.
+
+Built once per snapshot. Category -> sorted row-id arrays, tag -> packed
+bitmaps (one bit per row), so "any of these tags within these categories"
+is a few bitwise ops on n/8 bytes instead of a DataFrame scan and copy.
+"""
+import numpy as np
+
+
+class MenuIndex:
+    def __init__(self, snap):
+        self.n = len(snap)
+        codes = np.asarray(snap.category_codes)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(snap.categories) + 1))
+        self.by_category = {c: order[bounds[i]:bounds[i + 1]] for i, c in enumerate(snap.categories)}
+        self._category_bits = {c: self._pack(rows) for c, rows in self.by_category.items()}
+        bits = np.asarray(snap.tag_bits)
+        self.tags = list(snap.tag_vocab)
+        self.by_tag = {t: np.packbits((bits[:, j >> 3] >> (7 - (j & 7))) & 1) for j, t in enumerate(self.tags)}
+
+    def _pack(self, rows):
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def _union(self, bitmaps):
+        out = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        for b in bitmaps:
+            out |= b
+        return out
+
+    def category_rows(self, category) -> np.ndarray:
+        return self.by_category.get(category, np.empty(0, dtype=np.intp))
+
+    def rows(self, categories=None, tags=None) -> np.ndarray:
+        """Sorted row ids in any of ``categories`` having any of ``tags`` (None = no filter on that axis)."""
+        if categories is not None and tags is None:
+            cats = [c for c in categories if c in self.by_category]
+            if len(cats) == 1: return self.by_category[cats[0]]
+            return np.sort(np.concatenate([self.by_category[c] for c in cats])) if cats else np.empty(0, dtype=np.intp)
+        mask = None
+        if categories is not None:
+            mask = self._union(self._category_bits[c] for c in categories if c in self._category_bits)
+        if tags is not None:
+            tag_mask = self._union(self.by_tag[t] for t in tags if t in self.by_tag)
+            mask = tag_mask if mask is None else mask & tag_mask
+        if mask is None: return np.arange(self.n)
+        return np.flatnonzero(np.unpackbits(mask, count=self.n))
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Compiled menu snapshots.
+
+``menu.csv`` is parsed once into column arrays (interned categories, packed
+tag bitsets, price/sweetness ints) saved as ``.npy`` files under
+``.menu_cache/``. Later processes memory-map those files instead of parsing
+the CSV. A snapshot is rebuilt only when the CSV's mtime/size change and its
+SHA-1 no longer matches. ``MenuWatcher`` does that in the background for a
+running process, so menu edits go live without a restart.
+"""
+import hashlib, json, logging, os, shutil, tempfile, threading
+
+import numpy as np
+import pandas as pd
+
+from . import trace
+
+log = logging.getLogger(__name__)
+REQUIRED_COLUMNS = {"category", "name", "price", "sweetness", "tags"}
+SNAPSHOT_FORMAT = 1
+_ARRAYS = ("category_codes", "names", "price", "sweetness", "tags_raw", "tag_bits")
+
+
+class MenuColumnsError(ValueError):
+    def __init__(self, missing):
+        super().__init__(f"menu is missing columns: {sorted(missing)}")
+        self.missing = missing
+
+
+def split_tags(s) -> list:
+    return [t.strip() for t in (s or "").split(",") if t.strip()]
+
+
+class MenuSnapshot:
+    """One menu version as column arrays; ``tag_bits`` is ``np.packbits`` of the item x tag_vocab one-hot matrix."""
+
+    def __init__(self, category_codes, categories, names, price, sweetness, tags_raw, tag_bits, tag_vocab, sha1=""):
+        self.category_codes, self.categories = category_codes, list(categories)
+        self.names, self.price, self.sweetness = names, price, sweetness
+        self.tags_raw, self.tag_bits, self.tag_vocab = tags_raw, tag_bits, list(tag_vocab)
+        self.sha1 = sha1
+
+    def __len__(self):
+        return len(self.price)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, sha1: str = ""):
+        missing = REQUIRED_COLUMNS - set(df.columns)
+        if missing: raise MenuColumnsError(missing)
+        if df.empty: raise ValueError("menu has no items")
+        blank = [c for c in ("price", "sweetness") if df[c].isna().any()]
+        if blank: raise ValueError(f"menu has blank {'/'.join(blank)}")
+        cat = pd.Categorical(df["category"].astype(str))
+        tags_raw = df["tags"].fillna("").astype(str)
+        tags_col = [split_tags(s) for s in tags_raw]
+        vocab = sorted({t for tags in tags_col for t in tags})
+        index = {t: i for i, t in enumerate(vocab)}
+        onehot = np.zeros((len(df), len(vocab)), dtype=np.uint8)
+        rows = np.repeat(np.arange(len(df)), [len(tags) for tags in tags_col])
+        onehot[rows, [index[t] for tags in tags_col for t in tags]] = 1
+        return cls(cat.codes.astype(np.int16), cat.categories, df["name"].astype(str).to_numpy(dtype=str),
+                   df["price"].to_numpy(dtype=np.int64), df["sweetness"].to_numpy(dtype=np.int64),
+                   tags_raw.to_numpy(dtype=str), np.packbits(onehot, axis=1), vocab, sha1)
+
+    @classmethod
+    def from_csv(cls, path: str):
+        return cls.from_frame(pd.read_csv(path), sha1=file_sha1(path))
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        meta = {"format": SNAPSHOT_FORMAT, "sha1": self.sha1, "categories": self.categories, "tag_vocab": self.tag_vocab}
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"snapshot format {meta.get('format')} != {SNAPSHOT_FORMAT}")
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None) for name in _ARRAYS}
+        return cls(categories=meta["categories"], tag_vocab=meta["tag_vocab"], sha1=meta["sha1"], **arrays)
+
+    def category_of(self, i: int) -> str:
+        return self.categories[self.category_codes[i]]
+
+    def tags_list(self, i: int) -> list:
+        return split_tags(self.tags_raw[i])
+
+    def frame(self) -> pd.DataFrame:
+        """DataFrame view for the UI (RangeIndex = snapshot row id; category is a Categorical)."""
+        return pd.DataFrame({
+            "category": pd.Categorical.from_codes(np.asarray(self.category_codes), self.categories),
+            "name": np.asarray(self.names, dtype=object),
+            "price": self.price,
+            "sweetness": self.sweetness,
+            "tags": np.asarray(self.tags_raw, dtype=object),
+        })
+
+
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path, obj):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+@trace.traced('menu.load_snapshot')
+def load_menu_snapshot(csv_path: str, cache_dir: str = None) -> MenuSnapshot:
+    """Memory-map the compiled snapshot of ``csv_path``, compiling it first if the CSV changed."""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(csv_path)), ".menu_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.basename(csv_path)
+    pointer = os.path.join(cache_dir, base + ".json")
+    st = os.stat(csv_path)
+    try:
+        with open(pointer, encoding="utf-8") as f:
+            ptr = json.load(f)
+    except (OSError, ValueError):
+        ptr = {}
+    if ptr.get("mtime_ns") == st.st_mtime_ns and ptr.get("size") == st.st_size:
+        try:
+            return MenuSnapshot.load(os.path.join(cache_dir, ptr["dir"]))
+        except (OSError, ValueError, KeyError):
+            pass  # missing or stale format: fall through and rebuild
+    sha1 = file_sha1(csv_path)
+    name = f"{base}-{sha1[:16]}"
+    target = os.path.join(cache_dir, name)
+    try:
+        snap = MenuSnapshot.load(target)
+    except (OSError, ValueError, KeyError):
+        snap = MenuSnapshot.from_csv(csv_path)
+        tmp = tempfile.mkdtemp(dir=cache_dir, prefix=name + ".tmp")
+        snap.save(tmp)
+        shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(tmp, target)
+        except OSError:  # another process won the race; its copy is identical
+            shutil.rmtree(tmp, ignore_errors=True)
+        snap = MenuSnapshot.load(target)
+    _write_json(pointer, {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha1": sha1, "dir": name})
+    for old in os.listdir(cache_dir):  # older versions of this CSV (open mmaps stay valid on POSIX)
+        if old.startswith(base + "-") and old != name and ".tmp" not in old:
+            shutil.rmtree(os.path.join(cache_dir, old), ignore_errors=True)
+    return snap
+
+
+class MenuWatcher:
+    """Polls ``csv_path`` and hands every new valid version to ``on_change(snap)``.
+
+    Runs on a daemon thread, never on a request thread: a changed (mtime, size)
+    has to hold for one more poll (the editor is done writing), then the
+    snapshot is compiled and validated there and ``on_change`` builds what
+    derives from it and swaps it in. A file that fails to parse keeps the
+    current version live and is logged once; a touch that leaves the content
+    (SHA-1) unchanged is ignored.
+    """
+
+    def __init__(self, csv_path: str, on_change, interval: float = 2.0, version: str = None, cache_dir: str = None):
+        self.csv_path, self.on_change, self.interval, self.cache_dir = csv_path, on_change, interval, cache_dir
+        self.version = version
+        self.stamp = self._pending = self._stat()
+        self.reloads = self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.csv_path)
+        except OSError:
+            return None  # mid-replace or deleted: keep serving what we have
+        return st.st_mtime_ns, st.st_size
+
+    def check(self) -> bool:
+        """One poll; True if a new version was swapped in."""
+        stamp = self._stat()
+        if stamp is None or stamp == self.stamp: return False
+        if stamp != self._pending:
+            self._pending = stamp
+            return False
+        self.stamp = stamp
+        try:
+            snap = load_menu_snapshot(self.csv_path, self.cache_dir)
+        except (OSError, ValueError) as e:  # MenuColumnsError, pandas ParserError, bad prices
+            self.failures += 1
+            log.warning("menu %s not reloaded, keeping version %s: %s", self.csv_path, (self.version or "")[:12], e)
+            return False
+        if snap.sha1 == self.version: return False
+        self.on_change(snap)
+        log.info("menu %s reloaded: version %s -> %s", self.csv_path, (self.version or "")[:12], snap.sha1[:12])
+        self.version = snap.sha1
+        self.reloads += 1
+        trace.incr('menu.reload')
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                log.exception("menu watcher for %s", self.csv_path)
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="lucy-menu-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {"path": self.csv_path, "version": self.version, "reloads": self.reloads, "failures": self.failures}
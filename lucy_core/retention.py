@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""Monthly archival and compaction of lucy.db.
+
+Orders (with their order_items), visits and closed coupons older than the hot
+window (``keep_months``, the current month included) move to one SQLite file
+per month, ``lucy-archive/YYYY-MM.db`` next to lucy.db, with the same tables
+and row ids. lucy.db keeps users, live coupons, the code sequences and the
+agg_* tables, which counted the archived rows when they were inserted (there
+are no DELETE triggers, so dashboards do not change). ``db.fetch_last_order``
+falls back to the archives newest first, and ``analytics.item_sales`` adds
+the archives its day range reaches.
+
+A month moves in two steps, so a crash never loses rows. Its rows are copied
+into the archive and committed (rewriting any earlier partial copy), then
+deleted from lucy.db in id-range chunks where the archived copy is still
+identical (a coupon used in between stays hot and moves next time). Month
+boundaries come from a binary search on the AUTOINCREMENT ids, which are
+handed out in time order, so no created_at index is needed. Launch coupons
+that are active or used never move: the partial unique index on lucy.db is
+what keeps them one per customer.
+
+``compact`` gives freed pages back with ``PRAGMA incremental_vacuum`` and
+truncates the WAL with a checkpoint. A lucy.db created before
+auto_vacuum=INCREMENTAL was set needs one full ``VACUUM`` first
+(``--convert``). ``RetentionJob`` runs both on a schedule. Every Streamlit
+process, the server and cron may start one, but only the holder of
+``lucy.db-retention.lock`` works; the others retry each interval and take
+over when it exits. From cron:
+
+    python -m lucy_core.retention --db lucy.db --keep-months 3
+"""
+import argparse, datetime as dt, logging, os, sqlite3, tempfile, threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process job lock
+    fcntl = None
+
+from . import db, trace
+
+log = logging.getLogger(__name__)
+CHUNK_ROWS = 50_000
+VACUUM_PAGES = 2000
+VACUUM_BATCH = 256
+
+ARCHIVE_SCHEMA = (
+    '''CREATE TABLE orders(order_id INTEGER PRIMARY KEY, user_id INTEGER, items_json TEXT, total_price INTEGER,
+         order_code TEXT, created_at TEXT)''',
+    'CREATE INDEX idx_orders_user_order ON orders(user_id, order_id DESC)',
+    '''CREATE TABLE order_items(order_id INTEGER NOT NULL, line INTEGER NOT NULL, menu_item_id INTEGER NOT NULL,
+         price INTEGER NOT NULL, PRIMARY KEY(order_id, line)) WITHOUT ROWID''',
+    'CREATE INDEX idx_order_items_item ON order_items(menu_item_id, order_id)',
+    'CREATE TABLE menu_items(menu_item_id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, category TEXT)',
+    '''CREATE TABLE visits(visit_id INTEGER PRIMARY KEY, user_id INTEGER, budget INTEGER, sweetness INTEGER,
+         tags TEXT, created_at TEXT)''',
+    'CREATE INDEX idx_visits_user_visit ON visits(user_id, visit_id)',
+    '''CREATE TABLE coupons(coupon_id INTEGER PRIMARY KEY, user_id INTEGER, code TEXT, kind TEXT, status TEXT,
+         issued_at TEXT, expires_at TEXT, meta_json TEXT)''',
+    'CREATE INDEX idx_coupons_user_kind_status ON coupons(user_id, kind, status)',
+)
+# table -> (id column, time column, columns, which rows may move)
+SOURCES = {
+    'orders': ('order_id', 'created_at', 'order_id, user_id, items_json, total_price, order_code, created_at', '1'),
+    'visits': ('visit_id', 'created_at', 'visit_id, user_id, budget, sweetness, tags, created_at', '1'),
+    'coupons': ('coupon_id', 'issued_at', 'coupon_id, user_id, code, kind, status, issued_at, expires_at, meta_json',
+                "status != 'active' AND NOT (kind = 'launch_cookie' AND status = 'used')"),
+}
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    conn.execute(f"PRAGMA busy_timeout={db.PRAGMAS['busy_timeout']}")
+    return conn
+
+
+def _add_months(month: str, k: int) -> str:
+    y, m = map(int, month.split('-'))
+    y, m = divmod(y * 12 + m - 1 + k, 12)
+    return f'{y:04d}-{m + 1:02d}'
+
+
+def _first_id_at(conn, table, id_col, ts_col, ts) -> int:
+    """Smallest id from which every row of ``table`` is at or after ``ts``."""
+    lo, hi = conn.execute(f'SELECT COALESCE(MIN({id_col}), 0), COALESCE(MAX({id_col}), -1) + 1 FROM main.{table}').fetchone()
+    while lo < hi:
+        mid = (lo + hi) // 2
+        rid, at = conn.execute(f'SELECT {id_col}, {ts_col} FROM main.{table} WHERE {id_col} >= ? ORDER BY {id_col} LIMIT 1',
+                               (mid,)).fetchone()
+        if (at or '') >= ts: hi = mid
+        else: lo = rid + 1
+    return lo
+
+
+def archive_path(month: str, path: str = None) -> str:
+    return os.path.join(db.archive_dir(path), f'{month}.db')
+
+
+def _open_archive(month, path):
+    """The month's archive file, created with its schema in one step (never seen half-built).
+
+    The file is built under a temporary name and hard-linked into place, which fails if it
+    exists: a concurrent job never replaces an archive another one already copied rows into.
+    """
+    target = archive_path(month, path)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp)
+            with conn:
+                for sql in ARCHIVE_SCHEMA:
+                    conn.execute(sql)
+            conn.close()
+            try:
+                os.link(tmp, target)
+            except FileExistsError:
+                pass  # another job created it first: use theirs
+        finally:
+            os.unlink(tmp)
+    return target
+
+
+def lock_path(path: str = None) -> str:
+    return (path or db.DB_PATH) + '-retention.lock'
+
+
+def try_lock(path: str = None):
+    """An open file holding ``path``'s retention lock, or None while another job holds it.
+
+    The lock is released when the file is closed or the process exits.
+    """
+    f = open(lock_path(path), 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+
+@trace.traced('retention.archive_month')
+def archive_month(month: str, path: str = None, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Move ``month``'s ('YYYY-MM') rows out of ``path`` into its archive file; returns rows moved per table."""
+    path = path or db.DB_PATH
+    start, end = f'{month}-01', f'{_add_months(month, 1)}-01'
+    moved = dict.fromkeys(SOURCES, 0)
+    conn = _connect(path)
+    try:
+        ranges = {t: (_first_id_at(conn, t, id_col, ts_col, start), _first_id_at(conn, t, id_col, ts_col, end))
+                  for t, (id_col, ts_col, _, _) in SOURCES.items()}
+        pick = {t: f'{id_col} >= ? AND {id_col} < ? AND {ts_col} >= ? AND {ts_col} < ? AND {movable}'
+                for t, (id_col, ts_col, _, movable) in SOURCES.items()}
+        if not any(conn.execute(f'SELECT 1 FROM main.{t} WHERE {pick[t]} LIMIT 1', (*ranges[t], start, end)).fetchone()
+                   for t in SOURCES):
+            return moved
+        conn.execute('ATTACH DATABASE ? AS arc', (_open_archive(month, path),))
+        try:
+            # 1. copy and commit (lucy.db is only read here, so its writers are not blocked)
+            conn.execute('BEGIN')
+            for t, (_, _, cols, _) in SOURCES.items():
+                conn.execute(f'INSERT OR REPLACE INTO arc.{t}({cols}) SELECT {cols} FROM main.{t} WHERE {pick[t]}',
+                             (*ranges[t], start, end))
+            conn.execute('''INSERT OR REPLACE INTO arc.order_items(order_id, line, menu_item_id, price)
+              SELECT order_id, line, menu_item_id, price FROM main.order_items
+              WHERE order_id IN (SELECT order_id FROM arc.orders WHERE order_id >= ? AND order_id < ?)''', ranges['orders'])
+            conn.execute('''INSERT OR REPLACE INTO arc.menu_items(menu_item_id, name, category)
+              SELECT menu_item_id, name, category FROM main.menu_items
+              WHERE menu_item_id IN (SELECT DISTINCT menu_item_id FROM arc.order_items)''')
+            conn.execute('COMMIT')
+            # 2. delete what is safely archived, a chunk per write transaction
+            for t, (id_col, _, _, _) in SOURCES.items():
+                same = 'c.status IS a.status' if t == 'coupons' else '1'
+                lo, hi = ranges[t]
+                for a in range(lo, hi, chunk_rows):
+                    b = min(a + chunk_rows, hi)
+                    archived = (f'SELECT a.{id_col} FROM arc.{t} a JOIN main.{t} c ON c.{id_col} = a.{id_col}'
+                                f' WHERE a.{id_col} >= ? AND a.{id_col} < ? AND {same}')
+                    conn.execute('BEGIN IMMEDIATE')
+                    if t == 'orders':
+                        conn.execute(f'DELETE FROM main.order_items WHERE order_id >= ? AND order_id < ? AND order_id IN ({archived})',
+                                     (a, b, a, b))
+                    moved[t] += conn.execute(f'DELETE FROM main.{t} WHERE {id_col} >= ? AND {id_col} < ? AND {id_col} IN ({archived})',
+                                             (a, b, a, b)).rowcount
+                    conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction: conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.execute('DETACH DATABASE arc')
+    finally:
+        conn.close()
+    log.info('archived %s of %s: %s', month, path, moved)
+    return moved
+
+
+def archive_closed(path: str = None, keep_months: int = 3, today: dt.date = None) -> dict:
+    """Archive every month before the last ``keep_months`` (this one included): {month: rows moved per table}."""
+    if keep_months < 1: raise ValueError('keep_months must be at least 1')
+    path = path or db.DB_PATH
+    first_kept = _add_months((today or dt.datetime.utcnow().date()).isoformat()[:7], 1 - keep_months)
+    conn = _connect(path)
+    try:
+        oldest = [conn.execute(f'SELECT {ts_col} FROM {t} ORDER BY {id_col} LIMIT 1').fetchone()
+                  for t, (id_col, ts_col, _, _) in SOURCES.items()]
+    finally:
+        conn.close()
+    month = min((r[0][:7] for r in oldest if r and r[0]), default=first_kept)
+    out = {}
+    while month < first_kept:
+        moved = archive_month(month, path)
+        if any(moved.values()): out[month] = moved
+        month = _add_months(month, 1)
+    return out
+
+
+@trace.traced('retention.compact')
+def compact(path: str = None, pages: int = VACUUM_PAGES, convert: bool = False) -> dict:
+    """Release up to ``pages`` free pages to the OS and checkpoint + truncate the WAL.
+
+    ``convert`` switches a database without incremental auto-vacuum over with one full VACUUM
+    (rewrites the whole file and blocks writers meanwhile: run it in a quiet hour).
+    """
+    conn = _connect(path or db.DB_PATH)
+    try:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode != 2 and convert:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        left = free
+        while mode == 2 and left and free - left < pages:
+            # the pragma frees one page per step and Python steps a result-less statement once,
+            # so run it per page, a batch per write transaction to keep writers waiting briefly
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for _ in range(min(VACUUM_BATCH, left, pages - (free - left))):
+                    conn.execute('PRAGMA incremental_vacuum')
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK'); raise
+            before, left = left, conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if left >= before: break
+        busy, wal_pages, _ = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        return {'incremental': mode == 2, 'released_pages': free - left, 'free_pages': left,
+                'checkpoint_busy': bool(busy), 'wal_pages': wal_pages}
+    finally:
+        conn.close()
+
+
+class RetentionJob:
+    """``archive_closed`` + ``compact`` on a daemon thread: once at start, then every ``interval`` seconds.
+
+    Only one job per database works: the first to take its retention lock keeps it until
+    stopped; the others skip their runs (``skipped``) until it is released.
+    """
+
+    def __init__(self, path: str = None, keep_months: int = 3, interval: float = 3600.0, vacuum_pages: int = VACUUM_PAGES):
+        self.path, self.keep_months, self.interval, self.vacuum_pages = path, keep_months, interval, vacuum_pages
+        self.runs = self.failures = self.skipped = 0
+        self._stop = threading.Event()
+        self._thread = self._lock = None
+
+    def run_once(self) -> dict:
+        """One run; None if another job holds the lock."""
+        if self._lock is None:
+            self._lock = try_lock(self.path)
+            if self._lock is None:
+                self.skipped += 1
+                return None
+        out = {'archived': archive_closed(self.path, self.keep_months), 'compact': compact(self.path, self.vacuum_pages)}
+        self.runs += 1
+        return out
+
+    def _run(self):
+        try:
+            while True:  # first run right after start, then every interval
+                try:
+                    self.run_once()
+                except Exception:
+                    self.failures += 1
+                    log.exception('retention run on %s', self.path or db.DB_PATH)
+                if self._stop.wait(self.interval): return
+        finally:
+            if self._lock is not None:
+                self._lock.close()
+                self._lock = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='lucy-retention', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Archive closed months of lucy.db and compact it.')
+    ap.add_argument('--db', default=db.DB_PATH)
+    ap.add_argument('--keep-months', type=int, default=3, help='months kept in the main database, this one included')
+    ap.add_argument('--vacuum-pages', type=int, default=VACUUM_PAGES, help='free pages to release per run')
+    ap.add_argument('--convert', action='store_true', help='switch to incremental auto-vacuum with one full VACUUM')
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    db.init_db(args.db)
+    lock = try_lock(args.db)
+    if lock is None:
+        print(f'{lock_path(args.db)} is held: another retention job is running')
+        return
+    with lock:
+        for month, moved in archive_closed(args.db, args.keep_months).items():
+            print(month, moved)
+        print(compact(args.db, args.vacuum_pages, args.convert))
+
+
+if __name__ == '__main__':
+    main()
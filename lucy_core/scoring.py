@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Vectorized menu scoring.
+
+The menu is encoded once (packed tag bitsets + int arrays) so that tag match,
+sweetness distance and the #인기 bonus are computed for every item in a single
+NumPy pass instead of a per-row ``df.apply``. A customer's taste vector
+(lucy_core.taste) adds one matrix-vector product over the same encoding.
+"""
+import numpy as np
+import pandas as pd
+
+POPULAR_TAG = "#인기"
+TASTE_WEIGHT = 3  # an item with the customer's favourite tags scores like one more chosen tag
+
+
+class MenuScorer:
+    """Precomputed encoding of a menu DataFrame (needs a ``tags_list`` column)."""
+
+    def __init__(self, df: pd.DataFrame, popular_bonus: int = 2):
+        tags_col = df["tags_list"].tolist()
+        vocab = sorted({t for tags in tags_col for t in tags})
+        index = {t: i for i, t in enumerate(vocab)}
+        onehot = np.zeros((len(df), len(vocab)), dtype=np.uint8)
+        rows = np.repeat(np.arange(len(df)), [len(tags) for tags in tags_col])
+        cols = np.fromiter((index[t] for tags in tags_col for t in tags), dtype=np.intp, count=len(rows))
+        onehot[rows, cols] = 1
+        self._init(pd.Index(df.index), vocab, np.packbits(onehot, axis=1),
+                   df["sweetness"].to_numpy(dtype=np.int64), df["price"].to_numpy(dtype=np.int64), popular_bonus)
+
+    @classmethod
+    def from_snapshot(cls, snap, popular_bonus: int = 2):
+        """Score straight off a MenuSnapshot's (memory-mapped) arrays; rows are labelled by snapshot row id."""
+        self = cls.__new__(cls)
+        self._init(pd.RangeIndex(len(snap)), snap.tag_vocab, snap.tag_bits, snap.sweetness, snap.price, popular_bonus)
+        return self
+
+    def _init(self, labels, vocab, tag_bits, sweetness, price, popular_bonus):
+        self.tag_index = {t: i for i, t in enumerate(vocab)}
+        self.labels = labels
+        self.tag_bits = tag_bits
+        self.sweetness, self.price = sweetness, price
+        pop = self.tag_index.get(POPULAR_TAG)
+        self.popular = self.tag_column(pop).astype(np.int64) if pop is not None else np.zeros(len(price), dtype=np.int64)
+        self.popular_bonus = popular_bonus
+        self._tag_matrix = None
+
+    def tag_column(self, j: int, pos=None) -> np.ndarray:
+        """0/1 array: which items (all, or rows ``pos``) carry tag ``j``."""
+        col = self.tag_bits[:, j >> 3] if pos is None else self.tag_bits[pos, j >> 3]
+        return (col >> (7 - (j & 7))) & 1
+
+    def positions(self, df: pd.DataFrame) -> np.ndarray:
+        """Row positions in the encoded menu for the rows of ``df`` (a filtered view of it)."""
+        pos = self.labels.get_indexer(df.index)
+        if (pos < 0).any():
+            raise KeyError("DataFrame rows are not part of the encoded menu")
+        return pos
+
+    def taste_bonus(self, taste: np.ndarray, pos=None) -> np.ndarray:
+        """0..TASTE_WEIGHT per item: its tags' share of the customer's favourite-tag count, capped at 1."""
+        if self._tag_matrix is None:  # float32 one-hot, built on first personalized request
+            self._tag_matrix = np.unpackbits(self.tag_bits, axis=1, count=len(self.tag_index)).astype(np.float32)
+        m = self._tag_matrix if pos is None else self._tag_matrix[pos]
+        top = float(taste.max()) if len(taste) else 0.0
+        if top <= 0: return np.zeros(len(m), dtype=np.int64)
+        return np.rint(TASTE_WEIGHT * np.minimum(1.0, m @ (taste / top))).astype(np.int64)
+
+    def score(self, chosen_tags, target_sweetness, pos=None, taste=None) -> np.ndarray:
+        cols = sorted({self.tag_index[t] for t in chosen_tags if t in self.tag_index})
+        sweet = self.sweetness if pos is None else self.sweetness[pos]
+        tag_match = np.zeros(len(sweet), dtype=np.int64)
+        for j in cols:
+            tag_match += self.tag_column(j, pos)
+        sweet_score = np.maximum(0, 3 - np.abs(sweet - int(target_sweetness)))
+        popular = self.popular if pos is None else self.popular[pos]
+        sc = tag_match * 3 + sweet_score + popular * self.popular_bonus
+        return sc if taste is None else sc + self.taste_bonus(taste, pos)
+
+    def rank_positions(self, pos, chosen_tags, sweet, taste=None):
+        """Rows ``pos`` ordered by score desc, price asc, then row order; returns (positions, scores)."""
+        pos = np.asarray(pos, dtype=np.intp)
+        sc = self.score(chosen_tags, sweet, pos, taste)
+        order = np.lexsort((np.arange(len(pos)), self.price[pos], -sc))
+        return pos[order], sc[order]
+
+    def rank(self, df: pd.DataFrame, chosen_tags, sweet) -> pd.DataFrame:
+        """``df`` sorted by score desc, price asc (ties keep menu order) with a ``_score`` column."""
+        if df.empty: return df.assign(_score=[])
+        pos = self.positions(df)
+        sc = self.score(chosen_tags, sweet, pos)
+        order = np.lexsort((np.arange(len(pos)), self.price[pos], -sc))
+        return df.iloc[order].assign(_score=sc[order]).reset_index(drop=True)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""HTTP/JSON front for LucyService (asyncio, stdlib only).
+
+One warm process (menu snapshot, result cache, DB pool) shared by every kiosk
+and the POS. ``GET /health`` reports menu version and cache stats, ``GET
+/metrics`` the lucy_core.trace histograms and counters in Prometheus text
+(with LUCY_TRACE set). Every other route is a POST whose JSON object body
+holds the keyword arguments of the LucyService method of the same role:
+
+  POST /recommend   recommend(budget, tags, sweetness, categories, topk, user_id)
+  POST /items       top_items(categories, tags, sweetness, limit, user_id)
+  POST /login       login(phone)
+  POST /visits      log_visit(user_id, budget, sweetness, tags)
+  POST /orders      order(user_id, items, total_price)
+  POST /last-order  last_order(user_id)
+
+Recommendations are answered on the event loop (memoized, sub-millisecond);
+DB calls run on a thread pool, and so does a personalized recommendation
+whose taste vector is not cached yet (its first request loads it). The loop
+never waits for a pooled connection. Connections are kept alive (HTTP/1.1).
+Edits to the menu CSV go live within a few --reload-interval polls, without
+dropping connections; every recommendation carries the ``menu_version`` it was
+computed from.
+
+    python -m lucy_core.server --menu menu.csv --port 8765
+"""
+import argparse, asyncio, json, logging, os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from . import db, trace
+from .menu import MenuWatcher
+from .retention import RetentionJob
+from .service import LucyService, Recommender
+
+log = logging.getLogger(__name__)
+MAX_BODY = 1 << 20
+# path -> (LucyService method, runs blocking DB work)
+ROUTES = {
+    "/recommend": ("recommend", False),
+    "/items": ("top_items", False),
+    "/login": ("login", True),
+    "/visits": ("log_visit", True),
+    "/orders": ("order", True),
+    "/last-order": ("last_order", True),
+}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ServiceServer:
+    def __init__(self, service: LucyService, workers: int = db.POOL_SIZE):
+        self.service = service
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="lucy-api")
+
+    async def dispatch(self, method: str, path: str, body: bytes):
+        if path in ("/health", "/metrics"):
+            if method != "GET": return 405, {"error": "use GET"}
+            return 200, self.service.health() if path == "/health" else trace.prometheus_text()
+        route = ROUTES.get(path)
+        if route is None: return 404, {"error": f"no route {path}"}
+        if method != "POST": return 405, {"error": "use POST"}
+        try:
+            args = json.loads(body or b"{}")
+            if not isinstance(args, dict): raise ValueError("body must be a JSON object")
+        except ValueError as e:
+            return 400, {"error": f"bad JSON: {e}"}
+        name, blocking = route
+        call = partial(self._traced, path, partial(getattr(self.service, name), **args))
+        try:
+            if blocking or self._reads_taste(args):
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, call)
+            else:
+                result = call()
+        except (TypeError, ValueError, KeyError) as e:
+            return 400, {"error": str(e)}
+        except Exception:
+            log.exception("%s %s failed", method, path)
+            return 500, {"error": "internal error"}
+        return 200, result
+
+    def _reads_taste(self, args) -> bool:
+        # a personalized ranking would read the taste vector from the DB on a cache miss
+        user_id = args.get("user_id")
+        if user_id is None: return False
+        try:
+            return int(user_id) not in self.service.rec.taste
+        except (TypeError, ValueError):
+            return False  # the service rejects it as a bad request without touching the DB
+
+    @staticmethod
+    def _traced(path, call):
+        # on whichever thread runs the call, so DB spans land in this request's trace
+        trace.begin(f"api {path}")
+        try:
+            return call()
+        finally:
+            trace.end()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                try:
+                    method, path, version = line.decode("latin-1").split()
+                except ValueError:
+                    self._send(writer, 400, {"error": "bad request line"}, False); break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""): break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                length = headers.get("content-length") or "0"
+                if not (length.isascii() and length.isdigit()):  # int() would also take "-1", "+1", "1_0"
+                    self._send(writer, 400, {"error": "bad content-length"}, False); break
+                n = int(length)
+                if n > MAX_BODY:
+                    self._send(writer, 413, {"error": f"body over {MAX_BODY} bytes"}, False); break
+                body = await reader.readexactly(n) if n else b""
+                status, payload = await self.dispatch(method, path.split("?", 1)[0], body)
+                keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                self._send(writer, status, payload, keep)
+                await writer.drain()
+                if not keep: break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _send(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {ctype}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        log.info("serving on %s", ", ".join(str(s.getsockname()) for s in server.sockets))
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--menu", default="menu.csv")
+    ap.add_argument("--db", default=db.DB_PATH)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--popular-bonus", type=int, default=2)
+    ap.add_argument("--cache-size", type=int, default=4096)
+    ap.add_argument("--taste-cache-size", type=int, default=10000, help="customers whose taste vectors stay in memory")
+    ap.add_argument("--warm-budgets", default=os.environ.get("LUCY_WARM_BUDGETS", ""),
+                    help="comma-separated budgets to precompute for --warm-categories")
+    ap.add_argument("--warm-categories", default="빵,샌드위치,샐러드,디저트")
+    ap.add_argument("--warm-tags", default="#달콤한,#짭짤한,#고소한,#바삭한,#촉촉한,#든든한,#가벼운,#초코,#과일")
+    ap.add_argument("--write-behind", action="store_true", help="queue visit logs for a background writer")
+    ap.add_argument("--reload-interval", type=float, default=2.0, help="seconds between menu file polls (0: never reload)")
+    ap.add_argument("--keep-months", type=int, default=0,
+                    help="archive history older than this many months hourly and compact the DB (0: keep everything)")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    db.DB_PATH = args.db
+    db.init_db()
+    if args.write_behind: db.enable_write_behind()
+    if args.keep_months: RetentionJob(args.db, args.keep_months).start()
+    rec = Recommender.from_csv(args.menu, popular_bonus=args.popular_bonus, cache_size=args.cache_size,
+                               taste_cache_size=args.taste_cache_size)
+    def warm(rec):
+        if args.warm_budgets:
+            n = rec.warm(args.warm_categories.split(","), args.warm_tags.split(","),
+                         [int(b) for b in args.warm_budgets.split(",")])
+            log.info("warmed %d recommendations", n)
+
+    warm(rec)
+    service = LucyService(rec)
+    # a new menu is built and warmed on the watcher thread, then swapped in
+    MenuWatcher(args.menu, lambda snap: service.swap_menu(snap, warm), args.reload_interval, rec.version).start()
+    asyncio.run(ServiceServer(service).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Headless recommendation and order service.
+
+``Recommender`` holds one menu snapshot (scorer, index, result cache, taste
+vectors) and answers with JSON-ready dicts; passing a ``user_id`` re-ranks by
+that customer's taste (lucy_core.taste). ``LucyService`` adds the customer and order
+calls from ``lucy_core.db``, and ``swap_menu`` replaces its Recommender with
+one for a new menu version (see lucy_core.menu.MenuWatcher); every call reads
+``self.rec`` once, so it answers from a single version and says which. ``lucy_core.server`` serves a LucyService over
+HTTP and ``lucy_core.client.ServiceClient`` has the same methods, so a page
+can run the core in-process or talk to one shared warm process.
+"""
+from . import db, trace
+from .cache import ResultCache, tag_choices, tag_key
+from .combos import Combo, top_combos
+from .index import MenuIndex
+from .menu import load_menu_snapshot
+from .scoring import MenuScorer
+from .taste import TasteVectors
+
+
+class Recommender:
+    """Ranking and combo search over one menu snapshot; ``categories=None`` means the whole menu."""
+
+    def __init__(self, snap, popular_bonus: int = 2, cache_size: int = 4096, taste_cache_size: int = 10000):
+        self.snap, self.popular_bonus = snap, popular_bonus
+        self.scorer = MenuScorer.from_snapshot(snap, popular_bonus)
+        self.index = MenuIndex(snap)
+        self.cache = ResultCache(cache_size)
+        self.cache.set_version(snap.sha1)
+        self.taste = TasteVectors(snap.tag_vocab, taste_cache_size)
+        self._row_of = {}
+        for i, name in enumerate(snap.names.tolist()):
+            self._row_of.setdefault(name, i)
+
+    @classmethod
+    def from_csv(cls, path: str, **kw):
+        return cls(load_menu_snapshot(path), **kw)
+
+    def successor(self, snap):
+        """A Recommender with these settings for another menu version. Row ids and prices change, so
+        the result cache starts empty; taste vectors carry over if the tag vocabulary is the same."""
+        rec = Recommender(snap, self.popular_bonus, self.cache.maxsize, self.taste.maxsize)
+        if rec.snap.tag_vocab == self.snap.tag_vocab: rec.taste = self.taste
+        return rec
+
+    @property
+    def version(self) -> str:
+        return self.snap.sha1
+
+    def item(self, i: int) -> dict:
+        s = self.snap
+        return {"id": int(i), "name": str(s.names[i]), "category": s.category_of(i), "price": int(s.price[i]),
+                "sweetness": int(s.sweetness[i]), "tags": s.tags_list(i)}
+
+    def with_tags(self, items) -> list:
+        """Order items with their menu ``tags`` filled in by name (what agg_user_order_tags counts)."""
+        out = []
+        for it in items:
+            i = self._row_of.get(it.get("name"))
+            out.append(dict(it, tags=self.snap.tags_list(i)) if i is not None and "tags" not in it else it)
+        return out
+
+    def taste_of(self, user_id):
+        """The customer's taste vector, or None (anonymous or no history yet: unpersonalized, shared cache)."""
+        if user_id is None: return None
+        vec = self.taste.get(int(user_id))
+        return vec if vec.any() else None
+
+    def min_price(self, categories=None):
+        rows = self.index.rows(categories)
+        return int(self.snap.price[rows].min()) if len(rows) else None
+
+    def ranked_rows(self, categories, tags, sweetness, limit=None, taste=None):
+        """(row ids, scores) by score desc, price asc, menu order."""
+        pos, sc = self.scorer.rank_positions(self.index.rows(categories), tags, sweetness, taste)
+        return pos[:limit], sc[:limit]
+
+    @trace.traced('recommend.ranked_items')
+    def ranked_items(self, categories, tags, sweetness, limit=None, user_id=None) -> list:
+        pos, sc = self.ranked_rows(categories, tags, sweetness, limit, self.taste_of(user_id))
+        return [dict(self.item(i), score=int(s)) for i, s in zip(pos.tolist(), sc.tolist())]
+
+    @trace.traced('recommend.combo_search')
+    def _combo_rows(self, categories, tags, sweetness, budget, topk, pool, max_items, taste=None):
+        pos, sc = self.ranked_rows(categories, tags, sweetness, pool, taste)
+        found = top_combos(self.snap.price[pos], sc, budget, topk=topk, max_items=max_items,
+                           ids=self.snap.names[pos].tolist())
+        return tuple((tuple(pos[list(p)].tolist()), int(total), score) for p, total, score, r in found)
+
+    def combo_rows(self, categories, tags, sweetness, budget, topk=3, pool=12, max_items=3, user_id=None):
+        """((row ids, total, score), ...) of the best combos, memoized per menu version (unless personalized)."""
+        tags, sweetness, budget = tag_key(tags), int(sweetness), int(budget)
+        taste = self.taste_of(user_id)
+        if taste is not None:  # one customer's ranking: not worth a shared cache slot
+            return self._combo_rows(categories, tags, sweetness, budget, topk, pool, max_items, taste)
+        key = (None if categories is None else frozenset(categories), tags, sweetness, budget, topk, pool, max_items)
+        return self.cache.get(key, lambda: self._combo_rows(categories, tags, sweetness, budget, topk, pool, max_items))
+
+    def combos(self, categories, tags, sweetness, budget, topk=3, pool=12, max_items=3, user_id=None) -> list:
+        """The best combos as ``Combo``s (row ids only), for pages that keep results across reruns."""
+        return [Combo(rows, total, score, self.version)
+                for rows, total, score in self.combo_rows(categories, tags, sweetness, budget, topk, pool, max_items, user_id)]
+
+    def resolve(self, combo):
+        """``combo``'s item dicts, or None if it indexes another menu version (reloaded since)."""
+        if combo.version != self.version: return None
+        return [self.item(i) for i in combo.rows]
+
+    @trace.traced('recommend.recommend_combos')
+    def recommend_combos(self, categories, tags, sweetness, budget, topk=3, pool=12, max_items=3, user_id=None) -> list:
+        return [{"items": [self.item(i) for i in rows], "total": total, "score": score}
+                for rows, total, score in self.combo_rows(categories, tags, sweetness, budget, topk, pool, max_items, user_id)]
+
+    def warm(self, categories, tags, budgets, max_tags=3, sweetness=range(6)) -> int:
+        """Fill the cache for every selection of <= ``max_tags`` of ``tags`` x sweetness x budget."""
+        n = 0
+        for chosen in tag_choices(tags, max_tags):
+            for s in sweetness:
+                for b in budgets:
+                    self.combo_rows(categories, chosen, s, b); n += 1
+        return n
+
+
+class LucyService:
+    """Everything a kiosk page needs, as calls taking and returning plain JSON values."""
+
+    def __init__(self, recommender: Recommender):
+        self.rec = recommender
+
+    def swap_menu(self, snap, prepare=None) -> Recommender:
+        """Serve ``snap`` from now on. The new Recommender is built (and passed to ``prepare``, e.g. to
+        warm its cache) before the one assignment that publishes it; calls already running finish on
+        the version they started with."""
+        rec = self.rec.successor(snap)
+        if prepare is not None: prepare(rec)
+        self.rec = rec
+        return rec
+
+    def health(self) -> dict:
+        rec = self.rec
+        return {"status": "ok", "menu_version": rec.version, "items": len(rec.snap),
+                "cache": rec.cache.stats(), "taste": rec.taste.stats()}
+
+    def recommend(self, budget, tags=(), sweetness=2, categories=None, topk=3, user_id=None) -> dict:
+        """Top combos within ``budget``; ``min_price`` lets the caller tell "budget too low" from "no match"."""
+        rec = self.rec
+        return {"combos": rec.recommend_combos(categories, tags, sweetness, budget, topk=topk, user_id=user_id),
+                "min_price": rec.min_price(categories), "menu_version": rec.version}
+
+    def top_items(self, categories=None, tags=(), sweetness=2, limit=3, user_id=None) -> dict:
+        rec = self.rec
+        return {"items": rec.ranked_items(categories, tags, sweetness, limit, user_id), "menu_version": rec.version}
+
+    def login(self, phone: str) -> dict:
+        return {"user_id": db.upsert_user(phone)}
+
+    def log_visit(self, user_id: int, budget: int, sweetness: int, tags=()) -> dict:
+        tags = list(tags)
+        # counted once the row is committed, so a vector loaded meanwhile cannot miss it
+        db.log_visit(user_id, int(budget), int(sweetness), tags, on_commit=lambda: self.rec.taste.add(user_id, tags))
+        return {}
+
+    def order(self, user_id: int, items: list, total_price: int) -> dict:
+        """Order + launch coupon (see db.place_order_with_coupon); ``coupon_code`` is None if already issued."""
+        rec = self.rec
+        items = rec.with_tags(items)
+        oc, code, expires = db.place_order_with_coupon(user_id, items, int(total_price))
+        rec.taste.add(user_id, [t for it in items for t in it.get("tags", ())])
+        return {"order_code": oc, "coupon_code": code, "expires_at": expires}
+
+    def last_order(self, user_id: int):
+        last = db.fetch_last_order(user_id)
+        if last is None: return None
+        items, created_at = last
+        return {"items": items, "created_at": created_at}
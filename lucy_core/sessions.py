@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Per-session page values kept out of ``st.session_state`` and evicted when idle.
+
+Streamlit holds a session's state until its browser tab has been gone for a
+while, and a kiosk or phone that simply stops interacting keeps it forever.
+Pages put their bulky per-session values (kept recommendation results, a
+pending order) here instead, under a session id stored in session_state.
+Sessions untouched for ``idle_ttl`` seconds, or beyond ``maxsize`` sessions
+(least recently active first), are dropped on the next access; a page then
+finds nothing and asks again. ``report`` shows what each live session holds.
+"""
+import pickle, threading, time
+from collections import OrderedDict
+
+from . import trace
+
+
+def _size(obj) -> int:
+    try:
+        return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    except Exception:  # unpicklable value: not worth failing a report over
+        return -1
+
+
+class SessionStore:
+    """Thread-safe session id -> {key: value}, ordered by last activity."""
+
+    def __init__(self, idle_ttl: float = 900.0, maxsize: int = 2000, clock=time.monotonic):
+        self.idle_ttl, self.maxsize, self.clock = idle_ttl, maxsize, clock
+        self.evicted = 0
+        self._data = OrderedDict()  # sid -> [last_active, {key: value}]
+        self._lock = threading.Lock()
+
+    def _session(self, sid):
+        # under the lock: mark sid active, then drop whoever has been idle too long
+        now = self.clock()
+        entry = self._data.get(sid)
+        if entry is None:
+            entry = self._data[sid] = [now, {}]
+        else:
+            entry[0] = now
+            self._data.move_to_end(sid)
+        self._evict(now)
+        return entry[1]
+
+    def _evict(self, now) -> int:
+        n = 0
+        while self._data:
+            last, _ = next(iter(self._data.values()))
+            if now - last < self.idle_ttl and len(self._data) <= self.maxsize: break
+            self._data.popitem(last=False); n += 1
+        if n:
+            self.evicted += n
+            trace.incr('sessions.evicted', n)
+        return n
+
+    def get(self, sid: str, key: str, default=None):
+        with self._lock:
+            return self._session(sid).get(key, default)
+
+    def set(self, sid: str, key: str, value):
+        with self._lock:
+            self._session(sid)[key] = value
+
+    def pop(self, sid: str, key: str, default=None):
+        with self._lock:
+            return self._session(sid).pop(key, default)
+
+    def touch(self, sid: str):
+        with self._lock:
+            self._session(sid)
+
+    def evict_idle(self) -> int:
+        """Drop idle sessions now (accesses do this anyway); returns how many."""
+        with self._lock:
+            return self._evict(self.clock())
+
+    def __len__(self):
+        return len(self._data)
+
+    def report(self) -> list:
+        """One row per live session, largest first: idle seconds, keys and pickled size in bytes."""
+        now = self.clock()
+        with self._lock:
+            live = [(sid, now - last, dict(values)) for sid, (last, values) in self._data.items()]
+        rows = [{"session": sid[:8], "idle_s": round(idle, 1), "keys": sorted(values), "bytes": _size(values)}
+                for sid, idle, values in live]
+        return sorted(rows, key=lambda r: -r["bytes"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._data), "maxsize": self.maxsize, "idle_ttl": self.idle_ttl,
+                    "evicted": self.evicted}
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Per-customer taste vectors for personalized ranking.
+
+A customer's taste is a count per menu tag: the tags they picked on visits
+(``agg_user_tags``) plus the tags of the items they ordered
+(``agg_user_order_tags``), both kept current by triggers. ``TasteVectors``
+holds them as fixed-width float32 arrays over one menu's tag vocabulary in a
+bounded LRU, so a request costs a dict lookup (one indexed query on a miss)
+and new orders/visits bump the cached vector instead of re-reading history.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import db, trace
+
+
+class TasteVectors:
+    """Thread-safe, size-bounded LRU of user_id -> tag-count vector over ``vocab``."""
+
+    def __init__(self, vocab, maxsize: int = 10000):
+        self.index = {t: i for i, t in enumerate(vocab)}
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._loading, self._stale = {}, set()  # user_id -> loads in flight; users counted during one
+        self._lock = threading.Lock()
+
+    def vector(self, counts: dict) -> np.ndarray:
+        vec = np.zeros(len(self.index), dtype=np.float32)
+        for tag, n in counts.items():
+            j = self.index.get(tag)
+            if j is not None: vec[j] += n
+        return vec
+
+    def get(self, user_id: int) -> np.ndarray:
+        """The customer's tag counts (all zeros for a new one). Treat as read-only: ``add`` replaces, never mutates."""
+        with self._lock:
+            vec = self._data.get(user_id)
+            if vec is not None:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        if vec is not None:
+            trace.incr('taste_cache.hit')
+            return vec
+        trace.incr('taste_cache.miss')
+        try:
+            vec = self.vector(db.fetch_taste_counts(user_id))
+        finally:
+            with self._lock:
+                stale = user_id in self._stale
+                self._loading[user_id] -= 1
+                if not self._loading[user_id]:
+                    del self._loading[user_id]
+                    self._stale.discard(user_id)
+        with self._lock:
+            if stale:  # a row committed while loading may be missing: answer, but don't keep it
+                return self._data.get(user_id, vec)
+            vec = self._data.setdefault(user_id, vec)  # keep one loaded or updated meanwhile
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return vec
+
+    def add(self, user_id: int, tags, n: int = 1):
+        """Count ``tags`` after they are committed to the DB. Only a cached vector changes; an
+        uncached one is loaded with them on its next ``get`` (a load already running is not kept)."""
+        cols = [self.index[t] for t in tags if t in self.index]
+        if not cols: return
+        with self._lock:
+            vec = self._data.get(user_id)
+            if vec is None:
+                if user_id in self._loading: self._stale.add(user_id)
+                return
+            vec = vec.copy()
+            np.add.at(vec, cols, n)
+            self._data[user_id] = vec
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, user_id):
+        """Whether ``get(user_id)`` would answer from memory (no hit/miss counted)."""
+        with self._lock:
+            return user_id in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
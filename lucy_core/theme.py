@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Shared look of the kiosk apps, without a font CDN or per-rerun CSS.
+
+Colours and corner radius live in ``.streamlit/config.toml`` (``[theme]``),
+which every app run from the repo root picks up and the frontend applies once
+per page load. The apps use ``type="primary"`` buttons for the filled look, so
+no ``<style>`` block is re-sent on each rerun. The config declares no font
+face: the demo app stays font-free and nothing is fetched from a CDN.
+
+The Elice DX Neolli font is meant for app_db_elice.py only, as a subset with
+just the characters that menu.csv and the app sources can put on screen, plus
+printable ASCII. Build it (needs ``pip install fonttools brotli``):
+
+    python -m lucy_core.theme --source EliceDXNeolli-Regular.woff2
+
+then commit ``static/fonts/EliceDXNeolli-subset.woff2``, declare it in
+config.toml (a declared face is only downloaded by an app whose font uses it)
+
+    [[theme.fontFaces]]
+    family = "Elice DX Neolli"
+    url = "app/static/fonts/EliceDXNeolli-subset.woff2"
+
+and select it for that app alone:
+
+    streamlit run app_db_elice.py --theme.font "Elice DX Neolli, Noto Sans KR, sans-serif"
+
+Rebuild it after menu or UI text changes.
+"""
+import argparse, glob, os
+
+FONT_OUTPUT = os.path.join("static", "fonts", "EliceDXNeolli-subset.woff2")
+ASCII = "".join(map(chr, range(0x20, 0x7F)))
+
+
+def used_text(paths) -> str:
+    """Every distinct character in ``paths`` plus printable ASCII, sorted."""
+    chars = set(ASCII)
+    for p in paths:
+        with open(p, encoding="utf-8-sig") as f:
+            chars.update(f.read())
+    return "".join(sorted(c for c in chars if c.isprintable()))
+
+
+def subset_font(source: str, output: str, text: str) -> int:
+    """Write the glyphs for ``text`` from ``source`` to ``output`` as WOFF2; returns its size in bytes."""
+    from fontTools import subset  # optional build-time dependency
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    subset.save_font(font, output, options)
+    return os.path.getsize(output)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Subset the UI font to the characters the apps can show.")
+    ap.add_argument("--source", required=True, help="full Elice DX Neolli font (ttf/otf/woff2)")
+    ap.add_argument("--output", default=FONT_OUTPUT)
+    ap.add_argument("--text-from", nargs="*", help="files whose characters to keep (default: *.csv and app_*.py)")
+    args = ap.parse_args(argv)
+    paths = args.text_from or sorted(glob.glob("*.csv") + glob.glob("app_*.py"))
+    text = used_text(paths)
+    try:
+        size = subset_font(args.source, args.output, text)
+    except ImportError as e:
+        ap.error(f"{e.name} is missing: pip install fonttools brotli")
+    print(f"{args.output}: {len(text)} characters, {size / 1024:.1f} KiB (from {', '.join(paths)})")
+
+
+if __name__ == "__main__":
+    main()
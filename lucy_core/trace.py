@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Lightweight tracing: timed spans, event counters and per-rerun breakdowns.
+
+Off unless ``LUCY_TRACE`` is set (or ``enable()`` is called). While off,
+``span()`` hands back one shared no-op context manager and ``@traced``
+functions and ``incr()`` cost a single flag check.
+
+While on, every span feeds a process-wide latency histogram and, if the
+thread has a trace open (``begin()``/``end()``, one per Streamlit rerun or
+API request), that trace's breakdown. Spans are aggregated flat by name and
+include the time of spans nested in them. Finished traces are kept in a
+small ring for the admin panel, optionally appended to ``LUCY_TRACE_JSONL``,
+and the histograms/counters render as Prometheus text.
+"""
+import contextlib, functools, json, os, threading, time
+from collections import deque
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+enabled = bool(os.environ.get('LUCY_TRACE'))
+jsonl_path = os.environ.get('LUCY_TRACE_JSONL')
+
+_lock = threading.Lock()
+_local = threading.local()
+_hist = {}       # span name -> [count per bucket..., count over the last bucket, sum of seconds]
+_counters = {}   # event name -> total
+_recent = deque(maxlen=50)
+_NULL = contextlib.nullcontext()
+
+
+def enable(jsonl: str = None):
+    global enabled, jsonl_path
+    enabled = True
+    if jsonl: jsonl_path = jsonl
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _hist.clear(); _counters.clear(); _recent.clear()
+
+
+def _record(name, seconds):
+    with _lock:
+        h = _hist.get(name)
+        if h is None: h = _hist[name] = [0] * (len(BUCKETS) + 2)
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]: i += 1
+        h[i] += 1; h[-1] += seconds
+    t = getattr(_local, 'trace', None)
+    if t is not None:
+        s = t['spans'].setdefault(name, [0, 0.0])
+        s[0] += 1; s[1] += seconds
+
+
+class _Span:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.t0)
+
+
+def span(name: str):
+    """``with span('db.fetch_last_order'): ...`` - timed when tracing is on, a no-op otherwise."""
+    return _Span(name) if enabled else _NULL
+
+
+def traced(name: str = None):
+    """Decorator form of ``span``; the span is named after the function unless ``name`` is given."""
+    def deco(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled: return fn(*args, **kwargs)
+            with _Span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def incr(name: str, n: int = 1):
+    if not enabled: return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    t = getattr(_local, 'trace', None)
+    if t is not None: t['counters'][name] = t['counters'].get(name, 0) + n
+
+
+def begin(label: str):
+    """Open this thread's trace (one per rerun/request); an unfinished previous one is dropped."""
+    if not enabled: return
+    _local.trace = {'label': label, 'ts': time.time(), 't0': time.perf_counter(), 'spans': {}, 'counters': {}}
+
+
+def _render(t):
+    total = time.perf_counter() - t['t0']
+    return {'label': t['label'], 'ts': t['ts'], 'total_ms': total * 1000,
+            'spans': {n: {'count': c, 'ms': s * 1000} for n, (c, s) in sorted(t['spans'].items(), key=lambda kv: -kv[1][1])},
+            'counters': dict(t['counters'])}
+
+
+def current():
+    """The open trace so far (for a panel drawn at the end of a rerun), or None."""
+    t = getattr(_local, 'trace', None)
+    return _render(t) if t is not None else None
+
+
+def end():
+    """Close this thread's trace, record it and return it (None if none was open)."""
+    t = getattr(_local, 'trace', None)
+    if t is None: return None
+    _local.trace = None
+    rec = _render(t)
+    _record(t['label'], rec['total_ms'] / 1000)
+    with _lock:
+        _recent.append(rec)
+        if jsonl_path:
+            with open(jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+    return rec
+
+
+def recent(n: int = 20) -> list:
+    with _lock:
+        return list(_recent)[-n:]
+
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def ratio(hit: str, miss: str):
+    """hit / (hit + miss) from the process counters, None before the first event."""
+    c = counters()
+    total = c.get(hit, 0) + c.get(miss, 0)
+    return c.get(hit, 0) / total if total else None
+
+
+def _label(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text() -> str:
+    """Histograms as ``lucy_span_seconds`` and counters as ``lucy_events_total`` (text format 0.0.4)."""
+    with _lock:
+        hist = {k: list(v) for k, v in _hist.items()}
+        cnt = dict(_counters)
+    out = ['# HELP lucy_span_seconds Time spent in traced spans.', '# TYPE lucy_span_seconds histogram']
+    for name, h in sorted(hist.items()):
+        acc, lbl = 0, _label(name)
+        for le, c in zip(BUCKETS, h):
+            acc += c
+            out.append(f'lucy_span_seconds_bucket{{span="{lbl}",le="{le}"}} {acc}')
+        acc += h[len(BUCKETS)]
+        out.append(f'lucy_span_seconds_bucket{{span="{lbl}",le="+Inf"}} {acc}')
+        out.append(f'lucy_span_seconds_sum{{span="{lbl}"}} {h[-1]:.6f}')
+        out.append(f'lucy_span_seconds_count{{span="{lbl}"}} {acc}')
+    out += ['# HELP lucy_events_total Traced event counts.', '# TYPE lucy_events_total counter']
+    out += [f'lucy_events_total{{name="{_label(k)}"}} {v}' for k, v in sorted(cnt.items())]
+    return '\n'.join(out) + '\n'
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Process-shared customer records for the kiosk's coupon and visit counts.
+
+``UserStore`` keeps ``{'visits', 'coupons'}`` per phone number in an LRU
+shared by every session of the process, so a rerun reads a dict instead of
+the database. Writes go through the backend first (``SQLiteBackend``:
+lucy.db, the same schema as app_db_elice.py; ``MemoryBackend``: this process
+only), and the cache then takes the record the backend returns. Operations on
+one phone are serialized by a striped lock, and different phones do not wait
+for each other.
+
+Another process writing the same phone is seen once the entry is evicted or
+rewritten here.
+"""
+import threading
+from collections import OrderedDict
+
+from . import db, trace
+
+
+class MemoryBackend:
+    """Records in a process-local dict: shared across sessions, lost on restart."""
+
+    def __init__(self):
+        self._records = {}
+
+    def load(self, phone):
+        rec = self._records.get(phone)
+        return dict(rec) if rec else None
+
+    def check_in(self, phone):
+        rec = self._records.get(phone)
+        new = rec is None
+        if new: rec = self._records[phone] = {'visits': 0, 'coupons': 0}
+        rec['visits'] += 1
+        return dict(rec), new
+
+    def complete_order(self, phone, record, use_coupon):
+        rec = self._records[phone]
+        redeemed = use_coupon and rec['coupons'] > 0
+        rec['coupons'] += 1 - redeemed
+        return dict(rec), redeemed
+
+
+class SQLiteBackend:
+    """Write-through to lucy.db: users.visit_count and coupons of kind 'order_thanks'."""
+
+    def load(self, phone):
+        return db.fetch_user_record(phone)
+
+    def check_in(self, phone):
+        return db.record_check_in(phone)
+
+    def complete_order(self, phone, record, use_coupon):
+        return db.complete_thanks_order(record['user_id'], use_coupon)
+
+
+class UserStore:
+    def __init__(self, backend, maxsize: int = 10000, stripes: int = 64):
+        self.backend, self.maxsize = backend, maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()  # guards _data only, never held across a backend call
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+
+    def _key_lock(self, phone):
+        return self._stripes[hash(phone) % len(self._stripes)]
+
+    def _cached(self, phone):
+        with self._lock:
+            rec = self._data.get(phone)
+            if rec is not None:
+                self._data.move_to_end(phone)
+                self.hits += 1
+            else:
+                self.misses += 1
+        trace.incr('user_store.hit' if rec is not None else 'user_store.miss')
+        return rec
+
+    def _put(self, phone, rec):
+        with self._lock:
+            self._data[phone] = rec
+            self._data.move_to_end(phone)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, phone: str):
+        """The phone's record (a copy), or None if it never checked in."""
+        rec = self._cached(phone)
+        if rec is None:
+            with self._key_lock(phone):
+                with self._lock:
+                    rec = self._data.get(phone)  # loaded by another session meanwhile
+                if rec is None:
+                    rec = self.backend.load(phone)
+                    if rec is None: return None
+                    self._put(phone, rec)
+        return dict(rec)
+
+    def check_in(self, phone: str):
+        """Register the phone or count another visit. Returns (record, is_new)."""
+        with self._key_lock(phone):
+            rec, new = self.backend.check_in(phone)
+            self._put(phone, rec)
+        return dict(rec), new
+
+    def complete_order(self, phone: str, use_coupon: bool = False):
+        """Redeem a coupon if asked (and one is left) and issue the order-thanks coupon.
+        Returns (record, redeemed)."""
+        with self._key_lock(phone):
+            rec = self._cached(phone) or self.backend.load(phone)
+            if rec is None: raise KeyError(phone)
+            rec, redeemed = self.backend.complete_order(phone, rec, use_coupon)
+            self._put(phone, rec)
+        return dict(rec), redeemed
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Write-behind queue: INSERTs are queued in-process and a background thread
+flushes them with ``executemany`` in one transaction every ``flush_ms`` or
+``flush_rows`` rows, whichever comes first.
+
+A full queue blocks the producer for up to ``put_timeout`` seconds and then
+writes the row synchronously, so rows are never dropped. ``close()`` (also
+registered with atexit) drains everything before the process exits. A row's
+``on_commit`` callback runs on the writer thread once the row is committed.
+"""
+import atexit, logging, queue, threading, time
+
+log = logging.getLogger(__name__)
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(self, pool, flush_ms: int = 200, flush_rows: int = 500, maxsize: int = 10000, put_timeout: float = 1.0):
+        self.pool = pool
+        self.flush_ms, self.flush_rows, self.put_timeout = flush_ms, flush_rows, put_timeout
+        self.flushed = self.batches = self.sync_fallbacks = 0
+        self._q = queue.Queue(maxsize)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='lucy-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, sql: str, params: tuple, on_commit=None):
+        if self._closed:
+            return self._write_one(sql, params, on_commit)
+        try:
+            self._q.put((sql, params, on_commit), timeout=self.put_timeout)
+        except queue.Full:
+            self.sync_fallbacks += 1
+            self._write_one(sql, params, on_commit)
+
+    def flush(self):
+        """Block until every row submitted so far is committed."""
+        self._q.join()
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        self._q.put(_STOP)
+        self._thread.join()
+        while True:  # rows from a submit() that raced with close()
+            try:
+                sql, params, on_commit = self._q.get_nowait()
+            except queue.Empty:
+                break
+            self._write_one(sql, params, on_commit); self._q.task_done()
+
+    def _write_one(self, sql, params, on_commit=None):
+        with self.pool.transaction(immediate=True) as conn:
+            conn.execute(sql, params)
+        self._committed([on_commit])
+
+    def _committed(self, callbacks):
+        for fn in callbacks:
+            if fn is None: continue
+            try:
+                fn()
+            except Exception:
+                log.exception('write-behind on_commit callback failed')
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, got = [], 1
+            item = self._q.get()
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while True:
+                if item is _STOP: stop = True
+                else: batch.append(item)
+                left = deadline - time.monotonic()
+                if not stop and (len(batch) >= self.flush_rows or left <= 0): break
+                try:
+                    # after the stop marker, drain whatever is left without waiting
+                    item = self._q.get_nowait() if stop else self._q.get(timeout=left)
+                except queue.Empty:
+                    break
+                got += 1
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in range(got): self._q.task_done()
+
+    def _write_batch(self, batch):
+        if not batch: return
+        by_sql = {}
+        for sql, params, _ in batch:
+            by_sql.setdefault(sql, []).append(params)
+        try:
+            with self.pool.transaction(immediate=True) as conn:
+                for sql, rows in by_sql.items():
+                    conn.executemany(sql, rows)
+        except Exception:
+            # one bad row must not take the batch down with it: retry row by row
+            log.exception('write-behind batch of %d rows failed; retrying row by row', len(batch))
+            for sql, params, on_commit in batch:
+                try:
+                    self._write_one(sql, params, on_commit)
+                except Exception:
+                    log.exception('write-behind row dropped: %s %r', sql, params)
+        else:
+            self._committed([on_commit for _, _, on_commit in batch])
+        self.flushed += len(batch); self.batches += 1
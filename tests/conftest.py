@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lucy_core import db
+
+
+@pytest.fixture
+def lucy_db(tmp_path, monkeypatch):
+    """A freshly migrated lucy.db under tmp_path, set as the default database."""
+    path = str(tmp_path / 'lucy.db')
+    monkeypatch.setattr(db, 'DB_PATH', path)
+    db.init_db(path)
+    yield path
+    pool = db._pools.pop(path, None)
+    if pool is not None: pool.close()
+    db._allocators.pop(path, None)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os, subprocess, sys, threading, time
+
+from lucy_core import db
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+WORKER = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+from lucy_core import db
+db.DB_PATH = sys.argv[2]
+db.get_allocator().block = 16
+for _ in range(int(sys.argv[3])):
+    print(db.gen_order_code(), db.gen_coupon_code())
+'''
+
+
+def test_codes_unique_across_processes(lucy_db):
+    procs = [subprocess.Popen([sys.executable, '-c', WORKER, ROOT, lucy_db, '2000'], stdout=subprocess.PIPE, text=True)
+             for _ in range(2)]
+    lines = [line for p in procs for line in p.communicate(timeout=120)[0].split()]
+    assert all(p.returncode == 0 for p in procs)
+    orders, coupons = lines[0::2], lines[1::2]
+    assert len(orders) == len(coupons) == 4000
+    assert len(set(orders)) == len(orders) and len(set(coupons)) == len(coupons)
+
+
+def test_codes_inside_a_transaction(lucy_db):
+    # A holds the write lock and asks for codes while B waits for that lock to reserve a block
+    db.get_allocator(lucy_db).block = 4
+    in_txn, out, errors = threading.Event(), {}, []
+
+    def run(fn):
+        try:
+            fn()
+        except Exception as e:
+            errors.append(e)
+
+    def a():
+        with db.transaction(immediate=True):
+            in_txn.set()
+            time.sleep(0.2)
+            out['a'] = [db.gen_coupon_code() for _ in range(10)]
+
+    def b():
+        in_txn.wait()
+        out['b'] = [db.gen_coupon_code() for _ in range(10)]
+
+    threads = [threading.Thread(target=run, args=(fn,)) for fn in (a, b)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join(20)
+    assert not any(t.is_alive() for t in threads) and errors == []
+    assert time.perf_counter() - t0 < 5
+    assert len(set(out['a']) | set(out['b'])) == 20
+
+
+def test_rolled_back_number_is_not_cached(lucy_db):
+    db.get_allocator(lucy_db).block = 1
+    try:
+        with db.transaction(immediate=True):
+            lost = db.gen_order_code()
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    after = [db.gen_order_code() for _ in range(5)]
+    assert len(set(after)) == 5 and lost in after
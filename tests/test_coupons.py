@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from lucy_core import db
+
+
+def launch_coupons(user_id):
+    with db.transaction() as conn:
+        return conn.execute("SELECT code, status FROM coupons WHERE user_id=? AND kind='launch_cookie'",
+                            (user_id,)).fetchall()
+
+
+def test_racing_issues_give_one_coupon(lucy_db):
+    barrier, acks, errors = threading.Barrier(16), [], []
+
+    def issue():
+        barrier.wait()
+        try:
+            code, _ = db.issue_launch_cookie_coupon(1)
+            if code: acks.append(code)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=issue) for _ in range(16)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert errors == []
+    assert [tuple(r) for r in launch_coupons(1)] == [(acks[0], 'active')]
+    assert len(acks) == 1
+
+
+def test_no_second_coupon_after_use(lucy_db):
+    code, _ = db.issue_launch_cookie_coupon(2)
+    with db.transaction(immediate=True) as conn:
+        conn.execute("UPDATE coupons SET status='used' WHERE code=?", (code,))
+    assert db.issue_launch_cookie_coupon(2) == (None, None)
+    assert [tuple(r) for r in launch_coupons(2)] == [(code, 'used')]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from lucy_core import db
+
+
+def test_hot_queries_use_indexes(lucy_db):
+    plans = db.check_query_plans(lucy_db)  # raises on a table scan or temp b-tree sort
+    assert set(plans) == set(db.HOT_QUERIES)
+    for name, details in plans.items():
+        assert not any(d.startswith('SCAN') for d in details), (name, details)
+
+
+def test_dropped_index_fails_the_check(lucy_db):
+    conn = sqlite3.connect(lucy_db)
+    conn.execute('DROP INDEX idx_orders_user_order')
+    conn.close()
+    with pytest.raises(RuntimeError, match='fetch_last_order: SCAN orders'):
+        db.check_query_plans(lucy_db)
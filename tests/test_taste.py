@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from lucy_core import db
+from lucy_core.taste import TasteVectors
+
+TAGS = ['#달콤한']
+
+
+def log_visit(taste, uid):
+    db.log_visit(uid, 20000, 2, TAGS, on_commit=lambda: taste.add(uid, TAGS))
+
+
+def test_queued_visit_counted_after_flush(lucy_db):
+    taste, uid = TasteVectors(TAGS), db.upsert_user('01000000001')
+    writer = db.enable_write_behind(flush_ms=1000)
+    try:
+        log_visit(taste, uid)
+        assert taste.get(uid)[0] == 0  # loaded while the row is still queued
+        writer.flush()
+        assert taste.get(uid)[0] == 1
+    finally:
+        db.disable_write_behind()
+    assert taste.get(uid)[0] == db.fetch_taste_counts(uid)['#달콤한'] == 1
+
+
+def test_load_overlapping_a_commit_is_not_kept(lucy_db, monkeypatch):
+    taste, uid = TasteVectors(TAGS), db.upsert_user('01000000002')
+    fetch = db.fetch_taste_counts
+
+    def fetch_then_visit(user_id):
+        counts = fetch(user_id)
+        log_visit(taste, uid)  # committed after the load read its counts
+        return counts
+
+    monkeypatch.setattr(db, 'fetch_taste_counts', fetch_then_visit)
+    assert taste.get(uid)[0] == 0
+    monkeypatch.setattr(db, 'fetch_taste_counts', fetch)
+    assert taste.get(uid)[0] == 1
+    assert uid in taste